@@ -9,10 +9,17 @@ from pyogrio import read_dataframe
 import os
 import json
 import csv
+from concurrent.futures import ThreadPoolExecutor
+import pyarrow as pa
+import pyarrow.dataset as ds
 
-import use_case as uc
 import use_case_helpers
 import utility
+import input_cache
+import event_store
+import scheduler
+import ensemble
+import sweep
 
 
 # todo Output einer Metadatei programmieren: Info zu Anzahl an Ladepunkten, installierter Leistung, Energie
@@ -44,14 +51,19 @@ def parse_data(args):
     boundaries = gpd.read_file(pathlib.Path(data_dir, parser.get('data', 'boundaries')))
     boundaries = boundaries.to_crs(3035)
 
+    # Cache für eingelesene und reprojizierte Eingangsdaten (leer = kein Cache)
+    cache_dir = parser['data'].get('cache_dir', '')
+    cache_dir = pathlib.Path(data_dir, cache_dir) if cache_dir else None
+    input_cache.prune(cache_dir, parser['data'].getfloat('cache_max_age_days', 0))
+
     # create results dir
     timestamp_now = datetime.now()
     timestamp = timestamp_now.strftime("%y-%m-%d_%H%M%S")
     result_dir = pathlib.Path('results', '_{}'.format(timestamp))
     result_dir.mkdir(exist_ok=True, parents=True)
 
-    rng_seed = parser['basic'].getint('random_seed', None)
-    rng = np.random.default_rng(rng_seed)
+    # alle Zufallsströme (Einlesen, je Use-Case, je Verteilungsaufruf) werden aus dieser Sequenz abgeleitet
+    seed_sequence = np.random.SeedSequence(parser['basic'].getint('random_seed', None))
 
     config_dict = {
         'boundaries': boundaries,
@@ -68,51 +80,73 @@ def parse_data(args):
         'visual': parser.getboolean("basic", "plots"),
         # 'charge_info': charge_info_dict,
         'scenario_name': args.scenario,
-        'seed': rng_seed,
-        'random_seed': rng,
+        'seed': seed_sequence.entropy,
+        'seed_sequence': seed_sequence,
+        'random_seed': use_case_helpers.rng_stream(seed_sequence, "input"),
         'multi_use_concept': parser['basic'].getboolean('multi_use_concept', None),
         'multi_use_group': parser['basic'].get('multi_use_group').split(', '),
         'flexibility_multi_use': parser['basic'].getint('flexibility_multi_use', 0),
         'use_case_multi_use': parser['basic'].get("use_case_multi_use"),
+        'distribution_backend': parser['basic'].get('distribution_backend', 'numpy'),
+        'assignment_mode': parser['basic'].get('assignment_mode', 'sequential'),
+        'max_workers': parser['basic'].getint('max_workers', 1),
+        'right_size_charging_points': parser['basic'].getboolean('right_size_charging_points', False),
+        'output_formats': [f.strip() for f in parser['basic'].get('output_formats', 'csv, gpkg').split(',')],
+        'output_compression': parser['basic'].get('output_compression', 'zstd'),
+        'output_partitioned': parser['basic'].getboolean('output_partitioned', False),
+        'output_queue_mb': parser['basic'].getint('output_queue_mb', 0),
         'share_office_parking': parser['basic'].getfloat('share_office_parking'),
         'charge_events_private_path': parser.get('data', 'charging_events_private'),
         'charge_events_commercial_path': parser.get('data', 'charging_events_commercial'),
         'result_dir': result_dir,
         'results_summary': {}
     }
+    unknown_formats = set(config_dict['output_formats']) - set(utility.OUTPUT_FORMATS)
+    if unknown_formats:
+        raise ValueError(f"Unknown output formats {sorted(unknown_formats)}, choose from {utility.OUTPUT_FORMATS}.")
+    if config_dict['output_compression'] == 'none':
+        config_dict['output_compression'] = None
 
     if run_hpc:
-        hpc_pos_file = parser.get('data', 'hpc_positions_fuel_stations')
-        hpc_traffic = parser.get('data', 'hpc_traffic_count')
-        positions = gpd.read_file(pathlib.Path(data_dir, hpc_pos_file), encoding='latin1')
-        traffic = gpd.read_file(pathlib.Path(data_dir, hpc_traffic), encoding='latin1')
+        hpc_pos_file = pathlib.Path(data_dir, parser.get('data', 'hpc_positions_fuel_stations'))
+        hpc_traffic = pathlib.Path(data_dir, parser.get('data', 'hpc_traffic_count'))
+
+        def read_hpc():
+            positions = gpd.read_file(hpc_pos_file, encoding='latin1')
+            traffic = gpd.read_file(hpc_traffic, encoding='latin1')
+
+            # calculate weighted hpc locations
+            return utility.calculate_hpc_locations(positions, traffic)
 
-        # calculate weighted hpc locations
-        hpc_locations = utility.calculate_hpc_locations(positions, traffic)
+        hpc_locations = input_cache.load(cache_dir, "hpc_locations", [hpc_pos_file, hpc_traffic], read_hpc)
         config_dict["hpc_points"] = hpc_locations
         # if run_retail:
         #     config_dict["hpc_share_retail"] = parser.getfloat("uc_params", "hpc_share_retail"),
         print("--- parsing hpc data done ---")
 
     if run_home or run_public:
-        buildings_data_file = parser.get('data', 'building_data')
-        demand_profiles_data = parser.get('data', 'home_demand_profiles')
+        buildings_data_file = pathlib.Path(data_dir, parser.get('data', 'building_data'))
+        demand_profiles_data = pathlib.Path(data_dir, parser.get('data', 'home_demand_profiles'))
 
-        home_data = gpd.read_file(pathlib.Path(data_dir, buildings_data_file),
-                                       engine='pyogrio', use_arrow=True) # engine='pyogrio',
+        def read_home():
+            home_data = gpd.read_file(buildings_data_file,
+                                      engine='pyogrio', use_arrow=True) # engine='pyogrio',
 
-        demand_profiles = pd.read_csv(pathlib.Path(data_dir, demand_profiles_data))
-        demand_profiles.rename(columns={'building_id': 'id'}, inplace=True)
-        home_data = home_data.merge(demand_profiles[["id", "households_total"]], on='id', how='left')
+            demand_profiles = pd.read_csv(demand_profiles_data)
+            demand_profiles.rename(columns={'building_id': 'id'}, inplace=True)
+            home_data = home_data.merge(demand_profiles[["id", "households_total"]], on='id', how='left')
 
-        home_data = home_data.loc[(home_data["cts_demand"].astype(float) == 0) & (home_data["households_total"].notna())]
+            home_data = home_data.loc[(home_data["cts_demand"].astype(float) == 0) & (home_data["households_total"].notna())]
+            return home_data.to_crs(3035)
+
+        home_data = input_cache.load(cache_dir, "home_data", [buildings_data_file, demand_profiles_data], read_home)
 
         home_data_detached = home_data.loc[home_data["households_total"].isin([1, 2])]
         home_data_apartment = home_data.loc[~home_data["households_total"].isin([1, 2])]
         # buildings_data = read_dataframe(pathlib.Path(data_dir, buildings_data_file))
         print("--- parsing home data done ---")
-        buildings_data_file_detached = home_data_detached.to_crs(3035)
-        buildings_data_file_apartment = home_data_apartment.to_crs(3035)
+        buildings_data_file_detached = home_data_detached
+        buildings_data_file_apartment = home_data_apartment
 
         config_dict.update({
             "home_data_apartment": buildings_data_file_apartment,
@@ -120,13 +154,14 @@ def parse_data(args):
             "share_home_detached": parser.getfloat('uc_params', 'share_home_detached'),
             "share_home_apartment": parser.getfloat('uc_params', 'share_home_apartment')
         })
-        home_data_detached.to_file("data/home_data_detached.gpkg")
-        home_data_apartment.to_file("data/home_data_apartment.gpkg")
+        if parser['basic'].getboolean('export_derived_data', False):
+            utility.export_in_background({"home_data_detached": home_data_detached,
+                                          "home_data_apartment": home_data_apartment}, result_dir)
 
     if run_public:
-        public_data_file = parser.get('data', 'public_poi')
-        public_data = gpd.read_file(pathlib.Path(data_dir, public_data_file))
-        public_data = public_data.to_crs(3035)
+        public_data_file = pathlib.Path(data_dir, parser.get('data', 'public_poi'))
+        public_data = input_cache.load(cache_dir, "public_poi", [public_data_file],
+                                       lambda: gpd.read_file(public_data_file).to_crs(3035))
 
         public_home_street_data = home_data_apartment
 
@@ -138,14 +173,17 @@ def parse_data(args):
                             })
 
         if additional_public_input:
-            additional_public_locations_file = parser.get('data', 'additional_public_locations')
-            public_locations = gpd.read_file(pathlib.Path(data_dir, additional_public_locations_file))
+            additional_public_locations_file = pathlib.Path(data_dir, parser.get('data', 'additional_public_locations'))
+            public_locations = input_cache.load(cache_dir, "additional_public_locations",
+                                                [additional_public_locations_file],
+                                                lambda: utility.read_geo_file(additional_public_locations_file))
 
             # Sicherstellen, dass beide denselben CRS haben
             # additional_public_data = additional_public_locations.to_crs(public_data.crs)
 
-            additional_public_events_file = parser.get('data', 'additional_public_events')
-            public_events = gpd.read_file(pathlib.Path(data_dir, additional_public_events_file))
+            additional_public_events_file = pathlib.Path(data_dir, parser.get('data', 'additional_public_events'))
+            public_events = input_cache.load(cache_dir, "additional_public_events", [additional_public_events_file],
+                                             lambda: utility.read_geo_file(additional_public_events_file))
 
             # Innerer räumlicher Join: nur Punkte, die in beiden vorkommen (genau gleiche Geometrie)
             # public_data = public_data.merge(additional_public_data, on='geometry', how='inner', suffixes=('_1', '_2'))
@@ -172,47 +210,57 @@ def parse_data(args):
         work_retail = float(parser.get('uc_params', 'work_weight_retail'))
         work_commercial = float(parser.get('uc_params', 'work_weight_commercial'))
         work_industrial = float(parser.get('uc_params', 'work_weight_industrial'))
-        work_data_file = parser.get('data', 'work_data')
-        office_parking_data_file = parser.get('data', 'office_parking_lots_data')
-        work_data = gpd.read_file(pathlib.Path(data_dir, work_data_file),
-                             engine='pyogrio', use_arrow=True)
-        if config_dict["multi_use_concept"] and config_dict["use_case_multi_use"] == "work":
-            office_parking_data = gpd.read_file(pathlib.Path(data_dir, office_parking_data_file),
-                                 engine='pyogrio', use_arrow=True)
-            office_parking_data["area"] = 1 # office_parking_data.geometry.area
-            #         office_parking_data["geometry"] = office_parking_data["geometry"].centroid
+        work_data_file = pathlib.Path(data_dir, parser.get('data', 'work_data'))
+        office_parking_data_file = pathlib.Path(data_dir, parser.get('data', 'office_parking_lots_data'))
+        multi_use_work = bool(config_dict["multi_use_concept"]) and config_dict["use_case_multi_use"] == "work"
+        if multi_use_work:
+            def read_office_parking():
+                office_parking_data = gpd.read_file(office_parking_data_file,
+                                                    engine='pyogrio', use_arrow=True)
+                office_parking_data["area"] = 1 # office_parking_data.geometry.area
+                #         office_parking_data["geometry"] = office_parking_data["geometry"].centroid
+                return office_parking_data
+
+            office_parking_data = input_cache.load(cache_dir, "office_parking_data", [office_parking_data_file],
+                                                   read_office_parking)
             config_dict.update({'office_parking_data': office_parking_data})
 
-            # Eliminiere alle Work-punkte mit einem Buffer von 200m um die Office-Loactions
-
-            # 1) In projiziertes CRS (Meter) transformieren, falls noch nicht geschehen
-            meter_crs = "EPSG:25833"  # ETRS89 / UTM zone 33N (für Berlin). Anpassen, falls deine Daten woanders liegen.
-            if office_parking_data.crs is None or work_data.crs is None:
-                raise ValueError(
-                    "Bitte CRS für beide GeoDataFrames setzen (z. B. .set_crs('EPSG:4326') vor dem .to_crs()).")
-
-            office_parking_data_m = office_parking_data.to_crs(meter_crs)
-            work_data_m = work_data.to_crs(meter_crs)
-
-            # 2) 100-m-Buffer um Polygone
-            poly_buffer = office_parking_data_m.copy()
-            poly_buffer["geometry"] = poly_buffer.geometry.buffer(200)
-
-            # 3) Räumlicher Join: finde Punkte, die im Buffer liegen
-            # Hinweis: predicate='within' (oder 'intersects', wenn Punkte genau auf der Grenze mit entfernt werden sollen)
-            pts_in_buffer = gpd.sjoin(
-                work_data_m,
-                poly_buffer[["geometry"]],
-                predicate="within",
-                how="inner"
-            )
-
-            # 4) Diese Punkte aus dem Ursprungspunkte-Datensatz entfernen
-            work_data = work_data_m.loc[~work_data_m.index.isin(pts_in_buffer.index)].copy()
-
-
-        # work_data = work_data.loc[work_data["cts_demand"].astype(float) != 0]
-        work_data = work_data.to_crs(3035)
+        def read_work():
+            work_data = gpd.read_file(work_data_file,
+                                      engine='pyogrio', use_arrow=True)
+            if multi_use_work:
+                # Eliminiere alle Work-punkte mit einem Buffer von 200m um die Office-Loactions
+
+                # 1) In projiziertes CRS (Meter) transformieren, falls noch nicht geschehen
+                meter_crs = "EPSG:25833"  # ETRS89 / UTM zone 33N (für Berlin). Anpassen, falls deine Daten woanders liegen.
+                if office_parking_data.crs is None or work_data.crs is None:
+                    raise ValueError(
+                        "Bitte CRS für beide GeoDataFrames setzen (z. B. .set_crs('EPSG:4326') vor dem .to_crs()).")
+
+                office_parking_data_m = office_parking_data.to_crs(meter_crs)
+                work_data_m = work_data.to_crs(meter_crs)
+
+                # 2) 100-m-Buffer um Polygone
+                poly_buffer = office_parking_data_m.copy()
+                poly_buffer["geometry"] = poly_buffer.geometry.buffer(200)
+
+                # 3) Räumlicher Join: finde Punkte, die im Buffer liegen
+                # Hinweis: predicate='within' (oder 'intersects', wenn Punkte genau auf der Grenze mit entfernt werden sollen)
+                pts_in_buffer = gpd.sjoin(
+                    work_data_m,
+                    poly_buffer[["geometry"]],
+                    predicate="within",
+                    how="inner"
+                )
+
+                # 4) Diese Punkte aus dem Ursprungspunkte-Datensatz entfernen
+                work_data = work_data_m.loc[~work_data_m.index.isin(pts_in_buffer.index)].copy()
+
+            # work_data = work_data.loc[work_data["cts_demand"].astype(float) != 0]
+            return work_data.to_crs(3035)
+
+        work_sources = [work_data_file, office_parking_data_file] if multi_use_work else [work_data_file]
+        work_data = input_cache.load(cache_dir, "work", work_sources, read_work, multi_use_work=multi_use_work)
         work_dict = {'retail': work_retail, 'commercial': work_commercial, 'industrial': work_industrial}
         config_dict.update({'work': work_data, 'work_dict': work_dict})
         print("--- parsing work data done ---")
@@ -221,57 +269,88 @@ def parse_data(args):
         # zensus_data_file = parser.get('data', 'zensus_data')
         # zensus_data = gpd.read_file(pathlib.Path(data_dir, zensus_data_file))
         # zensus_data = zensus_data.to_crs(3035)
-        retail_data_file = parser.get('data', 'retail_data')
-
-        retail_data = gpd.read_file(pathlib.Path(data_dir, retail_data_file),
-                                       engine='pyogrio', use_arrow=True) # engine='pyogrio',
-        # buildings_data = read_dataframe(pathlib.Path(data_dir, buildings_data_file))
+        retail_data_file = pathlib.Path(data_dir, parser.get('data', 'retail_data'))
+
+        def read_retail():
+            retail_data = gpd.read_file(retail_data_file,
+                                        engine='pyogrio', use_arrow=True) # engine='pyogrio',
+            # buildings_data = read_dataframe(pathlib.Path(data_dir, buildings_data_file))
+            retail_data = retail_data.to_crs(3035)
+            retail_data["area"] = retail_data.geometry.area
+            retail_data["geometry"] = retail_data["geometry"].centroid
+            return retail_data
+
+        retail_data = input_cache.load(cache_dir, "retail_parking_lots", [retail_data_file], read_retail)
         print("--- parsing retail data done ---")
-        retail_data = retail_data.to_crs(3035)
-        retail_data["area"] = retail_data.geometry.area
-        retail_data["geometry"] = retail_data["geometry"].centroid
         config_dict.update({'retail_parking_lots': retail_data})
 
     if run_depot:
-        depot_data_file = parser.get('data', 'depot_data')
+        depot_data_file = pathlib.Path(data_dir, parser.get('data', 'depot_data'))
 
-        depot_data = gpd.read_file(pathlib.Path(data_dir, depot_data_file),
-                                    engine='pyogrio', use_arrow=True)  # engine='pyogrio',
+        depot_data = input_cache.load(cache_dir, "depot", [depot_data_file],
+                                      lambda: gpd.read_file(depot_data_file,
+                                                            engine='pyogrio', use_arrow=True))  # engine='pyogrio',
 
         config_dict.update({'depot': depot_data})
 
     return config_dict
 
 
-def parse_car_data(args, data_dict):
-    scenario_path = pathlib.Path(args.scenario)
-    ts_private_path = pathlib.Path(scenario_path, data_dict["charge_events_private_path"])
-    ts_commercial_path = pathlib.Path(scenario_path, data_dict["charge_events_commercial_path"])
+# kompaktes Schema der Ladeevents, wird einmal beim Einlesen gesetzt
+EVENT_CATEGORIES = ["charging_use_case", "use_case", "location", "Type", "car_type"]
+EVENT_DTYPES = {"event_id": "int32", "event_start": "int32", "event_time": "int32",
+                "energy": "float32", "soc_start": "float32", "soc_end": "float32"}
+
+
+def compact_event_schema(charging_events):
+    """String columns as categoricals, time steps as int32, energies and SoC as float32."""
+    dtypes = {column: "category" for column in EVENT_CATEGORIES if column in charging_events.columns}
+    dtypes.update({column: dtype for column, dtype in EVENT_DTYPES.items() if column in charging_events.columns})
+    return charging_events.astype(dtypes)
+
+
+def car_type_from_path(file_path):
+    # write car-type into column
+    antriebsarten = ['bev', 'phev']
+    fahrzeugklassen = ['mini', 'medium', 'luxury']
+
+    found_antrieb = next((word for word in antriebsarten if word in file_path.lower()), None)
+    found_klasse = next((word for word in fahrzeugklassen if word in file_path), None)
+    return f"{found_antrieb}_{found_klasse}"
 
-    dataframes = []
 
-    for file in os.listdir(ts_private_path):
-        if file.endswith(".parquet"):
-            file_path = os.path.join(ts_private_path, file)
-            df = pd.read_parquet(file_path)  # Read the Parquet file
-            # write car-type into column
-            antriebsarten = ['bev', 'phev']
-            fahrzeugklassen = ['mini', 'medium', 'luxury']
+def read_private_charging_events(ts_private_path, start, end):
+    """
+    Read the Parquet files of the private charging events, keeping events with start < event_start <= end
+    and a charging capacity != 0. Filter and column selection are applied while scanning and the files are
+    read in parallel threads, so only the filtered events are held in memory. car_type is derived from the
+    file name and stored as categorical.
+    """
+    files = sorted(os.path.join(ts_private_path, file) for file in os.listdir(ts_private_path)
+                   if file.endswith(".parquet"))
+    dataset = ds.dataset(files, format="parquet")
+    columns = [column for column in dataset.schema.names if column != "average_charging_power"]
+    event_filter = ((ds.field("station_charging_capacity") != 0)
+                    & (ds.field("event_start") > start) & (ds.field("event_start") <= end))
 
-            found_antrieb = next((word for word in antriebsarten if word in file_path.lower()), None)
-            found_klasse = next((word for word in fahrzeugklassen if word in file_path), None)
+    def read_file(fragment):
+        table = fragment.to_table(schema=dataset.schema, columns=columns, filter=event_filter)
+        car_type = pa.DictionaryArray.from_arrays(pa.array(np.zeros(table.num_rows, dtype=np.int32)),
+                                                  pa.array([car_type_from_path(fragment.path)]))
+        return table.append_column("car_type", car_type)
 
-            df["car_type"] = f"{found_antrieb}_{found_klasse}"
-            dataframes.append(df)
+    with ThreadPoolExecutor() as pool:
+        tables = list(pool.map(read_file, dataset.get_fragments()))
+    return pa.concat_tables(tables).to_pandas(self_destruct=True, split_blocks=True)
 
-    # Concatenate all DataFrames vertically
-    charging_events_private = pd.concat(dataframes, ignore_index=True)
 
-    # charging_events = pd.read_csv(ts_path, sep=",")
-    # charging_events = pd.read_parquet(ts_path)
-    charging_events_private = charging_events_private.loc[charging_events_private["station_charging_capacity"] != 0]
+def parse_car_data(args, data_dict, apply_time_limit=True):
+    scenario_path = pathlib.Path(args.scenario)
+    ts_private_path = pathlib.Path(scenario_path, data_dict["charge_events_private_path"])
+    ts_commercial_path = pathlib.Path(scenario_path, data_dict["charge_events_commercial_path"])
+
     # cut of first week and limit to one week
-    charging_events_private = charging_events_private.loc[charging_events_private["event_start"] > (24*7*4)]
+    charging_events_private = read_private_charging_events(ts_private_path, start=24*7*4, end=2*24*7*4)
     charging_events_private["event_start"] = charging_events_private["event_start"] - (24*7*4)
 
     charging_events_commercial = pd.read_parquet(ts_commercial_path)
@@ -293,27 +372,21 @@ def parse_car_data(args, data_dict):
     # todo: check, ob beide Datensätze zur gleichen Zeit am gleichen Tag starten.
     charging_events = pd.concat([charging_events_commercial, charging_events_private], ignore_index=True, sort=False)
 
-    charging_events = charging_events.drop(columns=["average_charging_power"])
+    # average_charging_power wird bei den privaten Events schon beim Einlesen weggelassen
+    charging_events = charging_events.drop(columns=["average_charging_power"], errors="ignore")
 
     charging_events = charging_events[charging_events["event_start"] <= (24*7*4)].reset_index(drop=True)
 
     charging_events["event_id"] = range(1, len(charging_events) + 1)
 
+    charging_events = compact_event_schema(charging_events)
+
     print ("--- parsing charging events done")
 
     if data_dict["run_home"]:
-        # Maske: nur dort, wo der zielwert vorkommt
-        maske = charging_events["charging_use_case"] == "home"
-        anzahl = maske.sum()
-
-        # Neue Werte zufällig generieren
-        neue_werte = data_dict["random_seed"].choice(["home_apartment", "home_detached"],
-                                      size=anzahl, p=[data_dict["share_home_apartment"], data_dict["share_home_detached"]])
+        charging_events = use_case_helpers.split_home_events(charging_events, data_dict)
 
-        # Einsetzen der neuen Werte
-        charging_events.loc[maske, "charging_use_case"] = neue_werte
-
-    if data_dict["charging_time_limit"]:
+    if data_dict["charging_time_limit"] and apply_time_limit:
 
         charging_use_case = "street"
         charging_events = use_case_helpers.park_time_limitation(charging_events, data_dict, charging_use_case)
@@ -325,10 +398,11 @@ def parse_car_data(args, data_dict):
     return charging_events
 
 
-def parse_default_data(args):
+def parse_default_data(args, apply_time_limit=True):
     data_dict = parse_data(args)
-    charging_event_data = parse_car_data(args, data_dict)
+    charging_event_data = parse_car_data(args, data_dict, apply_time_limit=apply_time_limit)
     data_dict["charging_event"] = charging_event_data
+    data_dict["event_store"] = event_store.EventStore(charging_event_data)
     data_dict["columns_output_locations"] = ["location_id", "charging_points", "average_charging_capacity", "geometry"]
     data_dict["columns_output_chargingevents"] = ["event_id", "charging_use_case", "car_type", "event_start", "event_time",
                                                   "energy", "soc_start", "soc_end", "station_charging_capacity",
@@ -347,81 +421,21 @@ def parse_potential_data(args):
 
 
 def run_use_cases(data_dict):
+    # unabhängige Use-Cases laufen bei max_workers > 1 parallel, public wartet auf den Multi-Use-Output
+    return scheduler.run(data_dict, max_workers=data_dict["max_workers"])
+
+def save_meta_data(data):
+    meta_data = {k: data.get(k) for k in ['seed', 'n_seeds', 'n_variants', 'charge_events_private_path',
+                                          'charge_events_commercial_path',
+                                          'multi_use_concept', 'flexibility_multi_use', 'multi_use_group',
+                                          'charging_time_limit', 'charging_time_limit_duration',
+                                          'charging_time_limit_start', 'charging_time_limit_end',
+                                          'output_formats', 'output_partitioned', 'right_size_charging_points']
+                 if k in data}
+
+    with open(os.path.join(data["result_dir"],'metadata.json'), 'w') as f:
+        json.dump(meta_data, f)
 
-    if data_dict['run_home']:
-        uc_name = "home_detached"
-        data_dict["results_summary"][uc_name] = {}
-        data_dict["results_summary"][uc_name]["charging_points"], data_dict["results_summary"][uc_name]["energy"], \
-            data_dict["results_summary"][uc_name]["installed_power"] = uc.home(data_dict['home_data_detached'],
-                data_dict, mode="detached")
-        uc_name = "home_apartment"
-        data_dict["results_summary"][uc_name] = {}
-        data_dict["results_summary"][uc_name]["charging_points"], data_dict["results_summary"][uc_name]["energy"], \
-            data_dict["results_summary"][uc_name]["installed_power"] = uc.home(data_dict['home_data_apartment'],
-                data_dict, mode="apartment")
-
-    if data_dict['run_work']:
-
-        if data_dict["multi_use_concept"] and data_dict["use_case_multi_use"] == "work":
-            uc_name_office = "work_office"
-            uc_name_not_office = "work_not_office"
-            data_dict["results_summary"][uc_name_office] = {}
-            data_dict["results_summary"][uc_name_not_office] = {}
-            (data_dict["results_summary"][uc_name_office]["charging_points"], data_dict["results_summary"][uc_name_office]["energy"], \
-                data_dict["results_summary"][uc_name_office]["installed_power"],data_dict["results_summary"][uc_name_not_office]["charging_points"],
-             data_dict["results_summary"][uc_name_not_office]["energy"], \
-                data_dict["results_summary"][uc_name_not_office]["installed_power"], charging_events_public_after_multi_use) = uc.work(data_dict["work"],
-                    data_dict, office_data=data_dict["office_parking_data"])
-        else:
-            uc_name = "work"
-            data_dict["results_summary"][uc_name] = {}
-            data_dict["results_summary"][uc_name]["charging_points"], data_dict["results_summary"][uc_name]["energy"], \
-                data_dict["results_summary"][uc_name]["installed_power"] = uc.work(data_dict[uc_name],
-                    data_dict)
-    if data_dict['run_hpc']:
-        uc_name = "hpc"
-        data_dict["results_summary"][uc_name] = {}
-        data_dict["results_summary"][uc_name]["charging_points"], data_dict["results_summary"][uc_name]["energy"], \
-            data_dict["results_summary"][uc_name]["installed_power"] = uc.hpc(data_dict['hpc_points'], data_dict)
-
-    if data_dict['run_retail']:
-        uc_name = "retail"
-        data_dict["results_summary"][uc_name] = {}
-        if data_dict["multi_use_concept"] and data_dict["use_case_multi_use"] == "retail":
-            data_dict["results_summary"][uc_name]["charging_points"], data_dict["results_summary"][uc_name]["energy"], \
-                data_dict["results_summary"][uc_name]["installed_power"], charging_events_public_after_multi_use = (
-                uc.retail(data_dict['retail_parking_lots'],
-                    data_dict))
-        else:
-            data_dict["results_summary"][uc_name]["charging_points"], data_dict["results_summary"][uc_name]["energy"], \
-                data_dict["results_summary"][uc_name]["installed_power"] = uc.retail(data_dict['retail_parking_lots'],
-                    data_dict)
-
-    if data_dict['run_public']:
-        uc_name = "public"
-        data_dict["results_summary"][uc_name] = {}
-
-        if data_dict["multi_use_concept"]:
-            data_dict["results_summary"][uc_name]["charging_points"], data_dict["results_summary"][uc_name]["energy"], \
-                data_dict["results_summary"][uc_name]["installed_power"] = uc.public(data_dict['poi_data'],
-                                                                                     data_dict['home_street_data'],
-                                                                                     data_dict,
-                                                                                     charging_locations_public_after_multi_use=charging_events_public_after_multi_use)
-        else:
-            data_dict["results_summary"][uc_name]["charging_points"], data_dict["results_summary"][uc_name]["energy"], \
-                data_dict["results_summary"][uc_name]["installed_power"] = uc.public(data_dict['poi_data'],
-                                                                                     data_dict['home_street_data'],
-                                                                                     data_dict)
-
-    if data_dict['run_depot']:
-        uc_name = "depot"
-        data_dict["results_summary"][uc_name] = {}
-
-        data_dict["results_summary"][uc_name]["charging_points"], data_dict["results_summary"][uc_name]["energy"], \
-        data_dict["results_summary"][uc_name]["installed_power"] = uc.depot(data_dict[uc_name],
-                data_dict)
-
-    return data_dict["results_summary"]
 
 def main():
     print('Reading input data...')
@@ -430,24 +444,44 @@ def main():
     parser.add_argument('scenario', nargs='?',
                            help='Set name of the scenario directory', default="scenario")
     parser.add_argument('--config_file', default="config.cfg", type=str)
+    parser.add_argument('--ensemble', default=0, type=int, metavar='N',
+                        help='Monte Carlo ensemble: run N seeds (random_seed, random_seed + 1, ...) on the same '
+                             'parsed input and write statistics over all seeds')
+    parser.add_argument('--sweep', default=None, type=str, metavar='FILE',
+                        help='Parameter sweep: sweep spec in the scenario directory, all variants share the '
+                             'parsed input')
     p_args = parser.parse_args()
 
+    if p_args.sweep is not None:
+        variants = sweep.read_spec(pathlib.Path('scenario', p_args.sweep))
+        # bei variierter Ladezeitbegrenzung wird sie je Variante auf die unbegrenzten Events angewendet
+        data = parse_default_data(p_args, apply_time_limit="time_limit" not in sweep.swept_stages(variants))
+        sweep.run(data, variants, max_workers=data["max_workers"])
+        utility.flush_results()
+        data["n_variants"] = len(variants)
+        save_meta_data(data)
+        utility.wait_for_exports()
+        return
+
     data = parse_default_data(p_args)
 
+    if p_args.ensemble > 0:
+        ensemble.run(data, p_args.ensemble, max_workers=data["max_workers"])
+        utility.flush_results()
+        data["n_seeds"] = p_args.ensemble
+        save_meta_data(data)
+        utility.wait_for_exports()
+        return
+
     result_summary = run_use_cases(data)
+    # alle Ergebnistabellen müssen geschrieben sein, bevor Metadaten und Zusammenfassung folgen
+    utility.flush_results()
 
     if data["visual"]:
         print("--- starting visualisation ---")
         # utility.plot_occupation_of_charging_points(result_summary)
 
-    # save meta data
-    meta_data = {k: data.get(k) for k in ['charge_events_private_path', 'charge_events_commercial_path',
-                                          'multi_use_concept', 'flexibility_multi_use', 'multi_use_group',
-                                          'charging_time_limit', 'charging_time_limit_duration',
-                                          'charging_time_limit_start', 'charging_time_limit_end']}
-
-    with open(os.path.join(data["result_dir"],'metadata.json'), 'w') as f:
-        json.dump(meta_data, f)
+    save_meta_data(data)
 
     flattened_data = []
 
@@ -465,6 +499,8 @@ def main():
         # Schreibe die Zeilen
         writer.writerows(flattened_data)
 
+    utility.wait_for_exports()
+
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,776 @@
+"""
+Capacity bookkeeping for the distribution of charging events onto locations.
+
+distribute_charging_events in use_case_helpers asks two questions per charging event: which is the
+first location (in index order) that still has a free charging point for the whole event window,
+and how does the occupancy change once the event is assigned. The classes in this module answer
+these questions without scanning every location for every event.
+"""
+import heapq
+import math
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+BACKENDS = ("numpy", "numba")
+ASSIGNMENT_MODES = ("sequential", "bucketed", "bucketed_relaxed")
+
+
+class FreeTimeIndex:
+    """
+    Earliest-free-time index over all charging points.
+
+    For every location with at least one charging point a heap holds the time step each of its
+    points becomes free again. A min segment tree over the location index stores the earliest free
+    time per location, so the first location with a point that is free at `start` is found in
+    O(log n_locations). Only valid if events are assigned in non-decreasing order of their start.
+    The use cases pass their events in the given, usually unsorted order, so in a normal run the
+    "sequential" assignment does not use the index; "bucketed" handles the events sorted by start.
+    """
+
+    _EMPTY = np.iinfo(np.int64).max
+
+    def __init__(self, n_locations: int):
+        size = 1
+        while size < max(n_locations, 1):
+            size *= 2
+        self._size = size
+        self._tree = [self._EMPTY] * (2 * size)
+        self._free_times = {}
+
+    def _update(self, loc: int, value: int):
+        tree = self._tree
+        pos = loc + self._size
+        tree[pos] = value
+        pos //= 2
+        while pos:
+            new = min(tree[2 * pos], tree[2 * pos + 1])
+            if tree[pos] == new:
+                break
+            tree[pos] = new
+            pos //= 2
+
+    def first_free(self, start: int) -> int:
+        """Smallest location index with a charging point free at `start`, -1 if there is none."""
+        tree = self._tree
+        if tree[1] > start:
+            return -1
+        pos = 1
+        while pos < self._size:
+            pos *= 2
+            if tree[pos] > start:
+                pos += 1
+        return pos - self._size
+
+    def occupy(self, loc: int, end: int):
+        """Occupy the earliest free point of `loc` until `end`."""
+        free_times = self._free_times[loc]
+        heapq.heapreplace(free_times, end)
+        self._update(loc, free_times[0])
+
+    def add_point(self, loc: int, end: int):
+        """Add a new charging point to `loc` that is occupied until `end`."""
+        free_times = self._free_times.setdefault(loc, [])
+        heapq.heappush(free_times, end)
+        self._update(loc, free_times[0])
+
+
+class AvailabilityStore:
+    """
+    Occupancy per time step, materialized only for locations that hold charging points.
+
+    The data is laid out time-major (time steps x active locations), so the slice of an event
+    window is one contiguous block. Columns are added when a location gets its first charging
+    point. The integer dtype starts at uint8 and is widened once the peak number of charging points
+    per location does not fit anymore. The horizon grows on demand.
+    """
+
+    _DTYPES = (np.uint8, np.uint16, np.uint32, np.uint64)
+
+    def __init__(self, n_locations: int, horizon: int, dtype=np.uint8):
+        self.n_locations = n_locations
+        self.column = np.full(n_locations, -1, dtype=np.int64)
+        self.data = np.zeros((max(horizon, 1), 16), dtype=dtype)
+        self.locations = np.empty(self.data.shape[1], dtype=np.int64)
+        self.n_columns = 0
+
+    @classmethod
+    def from_dense(cls, availability: np.ndarray):
+        """Build a store from a dense (locations x time steps) availability matrix."""
+        rows = np.flatnonzero(availability.any(axis=1))
+        return cls.from_columns(availability.shape[0], availability[rows].T, rows)
+
+    @classmethod
+    def from_intervals(cls, n_locations: int, horizon: int, locations: np.ndarray, starts: np.ndarray,
+                       ends: np.ndarray):
+        """Build a store from assigned events [start, end) with a difference array per location."""
+        store = cls(n_locations, max(horizon, int(ends.max()) if len(ends) else 0))
+        active, columns = np.unique(locations, return_inverse=True)
+        if len(active) == 0:
+            return store
+        diff = np.zeros((store.horizon + 1, len(active)), dtype=np.int32)
+        np.add.at(diff, (starts, columns), 1)
+        np.add.at(diff, (ends, columns), -1)
+        return cls.from_columns(n_locations, np.cumsum(diff, axis=0)[:-1], active)
+
+    @classmethod
+    def from_columns(cls, n_locations: int, occupancy: np.ndarray, locations: np.ndarray):
+        """Build a store from time-major occupancy columns and the location index of every column."""
+        store = cls(n_locations, occupancy.shape[0])
+        if len(locations) == 0:
+            return store
+        store.reserve(int(occupancy.max()))
+        store.data = np.ascontiguousarray(occupancy, dtype=store.data.dtype)
+        store.locations = np.array(locations, dtype=np.int64)
+        store.column[store.locations] = np.arange(len(locations))
+        store.n_columns = len(locations)
+        return store
+
+    @property
+    def horizon(self) -> int:
+        return self.data.shape[0]
+
+    @property
+    def active_locations(self) -> np.ndarray:
+        """Location index of every materialized column, in column order."""
+        return self.locations[:self.n_columns]
+
+    def copy(self):
+        store = AvailabilityStore.__new__(AvailabilityStore)
+        store.n_locations = self.n_locations
+        store.column = self.column.copy()
+        store.locations = self.locations.copy()
+        store.data = self.data.copy()
+        store.n_columns = self.n_columns
+        return store
+
+    def reserve(self, peak: int):
+        """Widen the dtype if occupancy values up to `peak` do not fit anymore."""
+        if peak <= np.iinfo(self.data.dtype).max:
+            return
+        dtype = next(d for d in self._DTYPES if np.iinfo(d).max >= peak)
+        self.data = self.data.astype(dtype)
+
+    def ensure_horizon(self, end: int):
+        if end > self.horizon:
+            extension = np.zeros((max(end, 2 * self.horizon) - self.horizon, self.data.shape[1]),
+                                 dtype=self.data.dtype)
+            self.data = np.concatenate([self.data, extension], axis=0)
+
+    def activate(self, loc: int) -> int:
+        """Column of `loc`, materialized if the location has none yet."""
+        col = self.column[loc]
+        if col >= 0:
+            return col
+        col = self.n_columns
+        if col == self.data.shape[1]:
+            self.data = np.concatenate([self.data, np.zeros_like(self.data)], axis=1)
+        if col == len(self.locations):
+            self.locations = np.resize(self.locations, self.data.shape[1])
+        self.locations[col] = loc
+        self.column[loc] = col
+        self.n_columns += 1
+        return col
+
+    def window(self, start: int, end: int) -> np.ndarray:
+        """View of the occupancy in [start, end) for all active locations (time x columns)."""
+        return self.data[start:end, :self.n_columns]
+
+    def add(self, loc: int, start: int, end: int):
+        """Occupy one charging point of `loc` during [start, end)."""
+        col = self.activate(loc)
+        self.ensure_horizon(end)
+        self.data[start:end, col] += 1
+
+
+class WeightedSampler:
+    """
+    Draws location indices with a probability proportional to their weight.
+
+    The cumulative distribution is built once per location set and uniforms are drawn from `rng` in
+    blocks, so every draw is a lookup instead of an O(n_locations) rng.choice call. The sequence of
+    indices is the same as calling rng.choice(n, p=weights / weights.sum()) once per draw.
+    The weights are validated with the first draw, so a location set nothing is drawn from (e.g. no
+    events) may be empty or have zero weights.
+    """
+
+    def __init__(self, weights, rng: np.random.Generator, block_size: int = 4096):
+        self._weights = np.asarray(weights, dtype=float)
+        self._cdf = None
+        self._rng = rng
+        self._block_size = block_size
+        self._block = np.empty(0, dtype=np.int64)
+        self._pos = 0
+
+    def __len__(self):
+        return len(self._weights)
+
+    def _lookup(self, uniforms: np.ndarray) -> np.ndarray:
+        if self._cdf is None:
+            weights = self._weights
+            if len(weights) == 0 or not np.all(np.isfinite(weights)) or np.any(weights < 0) or weights.sum() <= 0:
+                raise ValueError("Weights must be finite, non-negative and must not all be zero.")
+            cdf = (weights / weights.sum()).cumsum()
+            cdf /= cdf[-1]
+            self._cdf = cdf
+        return self._cdf.searchsorted(uniforms, side="right")
+
+    def draw(self) -> int:
+        """Draw one location index."""
+        if self._pos == len(self._block):
+            self._block = self._lookup(self._rng.random(self._block_size))
+            self._pos = 0
+        self._pos += 1
+        return int(self._block[self._pos - 1])
+
+    def draw_many(self, n: int) -> np.ndarray:
+        """Draw `n` location indices at once, continuing the sequence of draw()."""
+        buffered = self._block[self._pos:self._pos + n]
+        self._pos += len(buffered)
+        if len(buffered) == n:
+            return buffered.copy()
+        return np.concatenate([buffered, self._lookup(self._rng.random(n - len(buffered)))])
+
+
+class CapacityEngine:
+    """
+    Tracks charging points and occupancy of a set of locations during the distribution.
+
+    A location is free for the window [start, end) if its maximum occupancy in that window is lower
+    than its number of charging points. If the events arrive sorted by start, the occupancy after
+    `start` can only decrease, so the check reduces to the earliest free time of the location's
+    points and the FreeTimeIndex is used. Otherwise, which is the usual case for the events of a use
+    case, only the columns of the AvailabilityStore, i.e. locations that already hold a charging
+    point, are scanned. The events are not sorted here, since the order changes the result. Both strategies return the same
+    location as a scan over all locations. An event without duration fits at every location with a
+    charging point.
+    """
+
+    def __init__(self, store: AvailabilityStore, sorted_starts: bool = False):
+        self.store = store
+        self.charging_points = np.zeros(store.n_locations, dtype=int)
+        self._index = FreeTimeIndex(store.n_locations) if sorted_starts else None
+
+    def first_free(self, start: int, end: int) -> int:
+        """First location in index order with a free charging point in [start, end), else -1."""
+        if end <= start:
+            # leeres Zeitfenster: jeder Standort mit Ladepunkt ist frei, wie im numba-Kernel
+            return int(self.store.active_locations.min()) if self.store.n_columns else -1
+        if self._index is not None:
+            return self._index.first_free(start)
+        if self.store.n_columns == 0:
+            return -1
+        active = self.store.active_locations
+        in_use = self.store.window(start, end).max(axis=0)
+        free_mask = in_use < self.charging_points[active]
+        if free_mask.any():
+            return int(active[free_mask].min())
+        return -1
+
+    def occupy(self, loc: int, start: int, end: int):
+        """Assign an event to an existing, free charging point of `loc`."""
+        self.store.add(loc, start, end)
+        if self._index is not None and end > start:
+            self._index.occupy(loc, end)
+
+    def add_point(self, loc: int, start: int, end: int):
+        """Build a new charging point at `loc` and assign the event to it."""
+        self.charging_points[loc] += 1
+        self.store.reserve(self.charging_points[loc])
+        self.store.add(loc, start, end)
+        if self._index is not None:
+            self._index.add_point(loc, end)
+
+
+def add_points(charging_points: np.ndarray, average_capacity: np.ndarray, locations: np.ndarray,
+               capacities: np.ndarray):
+    """
+    Add one charging point per entry of `locations` and update the running mean of the capacity.
+
+    Equivalent to adding the points one by one in the given order. The running mean is applied in
+    rounds over the k-th new point of every location, so the floating point results are identical.
+    """
+    n_points = len(locations)
+    if n_points == 0:
+        return
+    # rank of every new point within the new points of its location, in the given order
+    order = np.argsort(locations, kind="stable")
+    sorted_locations = locations[order]
+    group_start = np.flatnonzero(np.r_[True, sorted_locations[1:] != sorted_locations[:-1]])
+    group_size = np.diff(np.r_[group_start, n_points])
+    ranks = np.empty(n_points, dtype=np.int64)
+    ranks[order] = np.arange(n_points) - np.repeat(group_start, group_size)
+
+    by_rank = np.argsort(ranks, kind="stable")
+    bounds = np.r_[0, np.cumsum(np.bincount(ranks))]
+    for rank in range(len(bounds) - 1):
+        idx = by_rank[bounds[rank]:bounds[rank + 1]]
+        locs = locations[idx]
+        prev_count = charging_points[locs]
+        average_capacity[locs] = (average_capacity[locs] * prev_count + capacities[idx]) / (prev_count + 1)
+        charging_points[locs] = prev_count + 1
+
+
+def peak_concurrency(locations: np.ndarray, starts: np.ndarray, ends: np.ndarray, n_locations: int) -> np.ndarray:
+    """
+    Maximum number of simultaneous events [start, end) per location index, 0 for locations without events.
+
+    Sweep over the sorted start (+1) and end (-1) points of all events, at equal time steps ends come
+    first. The running sum of a location returns to 0 after its last event, so one cumulative sum over
+    all locations sorted by location gives the occupancy of every location. O(E log E), no time grid.
+    """
+    locations = np.asarray(locations, dtype=np.int64)
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    keep = ends > starts
+    locations, starts, ends = locations[keep], starts[keep], ends[keep]
+
+    peaks = np.zeros(n_locations, dtype=np.int64)
+    if len(locations) == 0:
+        return peaks
+    point_locations = np.concatenate([locations, locations])
+    times = np.concatenate([starts, ends])
+    is_start = np.concatenate([np.ones(len(starts), dtype=np.int64), np.zeros(len(ends), dtype=np.int64)])
+    # ein Sortierschlüssel statt lexsort: Standort, dann Zeitschritt, dann Ende vor Start
+    offset = times.min()
+    key = (point_locations * (times.max() - offset + 1) + (times - offset)) * 2 + is_start
+    order = np.argsort(key)
+    running = np.cumsum(2 * is_start[order] - 1)
+    np.maximum.at(peaks, point_locations[order], running)
+    return peaks
+
+
+def reassign_with_capacity(starts: np.ndarray, ends: np.ndarray, preferred: np.ndarray, capacity: np.ndarray):
+    """
+    Assign events [start, end) to locations with a hard limit of `capacity` simultaneous events each.
+
+    Events are processed by start, longer events first at equal start. An event stays at its preferred
+    location if a point is free there, otherwise it goes to the location with the fewest occupied points
+    (lowest index at equal occupancy). Without a free point at any location the event is not served.
+
+    :param preferred: location index per event, -1 if the event has none
+    :param capacity: number of charging points per location index
+    :return: location index per event (-1: not served) and peak occupancy per location
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    preferred = np.asarray(preferred, dtype=np.int64)
+    n_locations = len(capacity)
+    assigned = np.full(len(starts), -1, dtype=np.int64)
+    if n_locations == 0:
+        return assigned, np.zeros(0, dtype=np.int64)
+
+    cap = np.asarray(capacity, dtype=np.int64).tolist()
+    load = [0] * n_locations
+    peak = [0] * n_locations
+    # Heap-Einträge als eine Zahl: Belegung * n_locations + Standort bzw. Ende * n_locations + Standort.
+    # Veraltete Einträge von available (Belegung hat sich geändert) werden beim Entnehmen übersprungen.
+    available = [loc for loc in range(n_locations) if cap[loc] > 0]
+    ending = []
+    result = assigned.tolist()
+
+    order = np.lexsort((starts - ends, starts))
+    for i, start, end, pref in zip(order.tolist(), starts[order].tolist(), ends[order].tolist(),
+                                   preferred[order].tolist()):
+        # beendete Ladevorgänge freigeben
+        while ending and ending[0] < (start + 1) * n_locations:
+            loc = heapq.heappop(ending) % n_locations
+            load[loc] -= 1
+            if load[loc] < cap[loc]:
+                heapq.heappush(available, load[loc] * n_locations + loc)
+
+        if pref >= 0 and load[pref] < cap[pref]:
+            chosen = pref
+        else:
+            chosen = -1
+            while available:
+                key = heapq.heappop(available)
+                if key // n_locations == load[key % n_locations]:
+                    chosen = key % n_locations
+                    break
+            if chosen < 0:
+                continue
+
+        load[chosen] += 1
+        if load[chosen] > peak[chosen]:
+            peak[chosen] = load[chosen]
+        heapq.heappush(ending, end * n_locations + chosen)
+        if load[chosen] < cap[chosen]:
+            heapq.heappush(available, load[chosen] * n_locations + chosen)
+        result[i] = chosen
+
+    return np.array(result, dtype=np.int64), np.array(peak, dtype=np.int64)
+
+
+def place_randomly(sampler: WeightedSampler, starts: np.ndarray, ends: np.ndarray, capacities: np.ndarray,
+                   return_store: bool = False):
+    """
+    Assign every event to a new charging point at a randomly drawn location, all at once.
+
+    Equivalent to drawing one location per event in event order and updating the number of charging
+    points and the running mean of the charging capacity per location.
+
+    :return: assigned location per event, charging points and average capacity per location and the
+        AvailabilityStore of the occupancy (None if return_store is False)
+    """
+    n_locations = len(sampler)
+    assigned = sampler.draw_many(len(starts))
+    charging_points = np.zeros(n_locations, dtype=np.int64)
+    average_capacity = np.zeros(n_locations, dtype=float)
+    add_points(charging_points, average_capacity, assigned, capacities)
+
+    store = None
+    if return_store:
+        store = AvailabilityStore.from_intervals(n_locations, int(ends.max()) if len(ends) else 0, assigned,
+                                                 starts, ends)
+    return assigned, charging_points, average_capacity, store
+
+
+def place_bucketed(sampler: WeightedSampler, starts: np.ndarray, ends: np.ndarray, capacities: np.ndarray,
+                   horizon: int, stable: bool = True):
+    """
+    Assign events bucket by bucket, one bucket per start time step, in chronological order.
+
+    Because all earlier events start no later than the current bucket, the occupancy of a location can
+    only decrease after the bucket's start. The free capacity of every location is therefore computed
+    once per bucket, the free charging points are handed out in location order and only the overflow
+    events draw new charging points. With `stable` events of the same start keep their input order and
+    the result equals place_fill_existing_first on the events sorted by start. Without it the order
+    inside a bucket is not preserved, which sorts faster but may hand the slots to other events.
+    Like CapacityEngine.first_free, an event without duration goes to the lowest location with a
+    charging point at that moment and occupies no point.
+
+    :return: assigned location per event, charging points and average capacity per location and the
+        AvailabilityStore of the occupancy
+    """
+    n_locations = len(sampler)
+    n_events = len(starts)
+    order = np.argsort(starts, kind="stable" if stable else "quicksort")
+    sorted_starts = starts[order]
+    sorted_ends = ends[order]
+    sorted_capacities = capacities[order]
+
+    timed = sorted_ends > sorted_starts
+    n_untimed = np.r_[0, np.cumsum(~timed)].tolist()
+
+    # release queue of the events with duration ordered by (end, start); an event is over at time s if
+    # end < s or end == s and start < s
+    key_base = int(sorted_starts.max()) + 1 if n_events else 1
+    timed_idx = np.flatnonzero(timed)
+    release_key = sorted_ends[timed_idx] * key_base + sorted_starts[timed_idx]
+    key_order = np.argsort(release_key, kind="stable")
+    release_order = timed_idx[key_order]
+    release_key = release_key[key_order]
+    released = 0
+
+    charging_points = np.zeros(n_locations, dtype=np.int64)
+    average_capacity = np.zeros(n_locations, dtype=float)
+    current = np.zeros(n_locations, dtype=np.int64)
+    active = np.empty(0, dtype=np.int64)
+    assigned_sorted = np.empty(n_events, dtype=np.int64)
+
+    # Grenzen der Buckets, ohne Events gibt es keinen
+    bounds = [0]
+    if n_events:
+        bounds = np.r_[np.flatnonzero(np.r_[True, sorted_starts[1:] != sorted_starts[:-1]]), n_events]
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        start = sorted_starts[lo]
+        stop = np.searchsorted(release_key, start * key_base + start, side="left")
+        if stop > released:
+            np.subtract.at(current, assigned_sorted[release_order[released:stop]], 1)
+            released = stop
+
+        bucket = np.arange(lo, hi)
+        untimed = bucket[:0]
+        if n_untimed[hi] > n_untimed[lo]:
+            untimed = bucket[~timed[lo:hi]]
+            bucket = bucket[timed[lo:hi]]
+        # ein Event ohne Dauer vor dem ersten Ladepunkt baut einen freien Ladepunkt, wie in first_free
+        if len(untimed) and untimed[0] == lo and not len(active):
+            locs = sampler.draw_many(1)
+            assigned_sorted[lo] = locs[0]
+            add_points(charging_points, average_capacity, locs, sorted_capacities[lo:lo + 1])
+            active = locs
+            untimed = untimed[1:]
+        lowest_active = int(active.min()) if len(active) else n_locations
+
+        # hand out the free charging points in location order
+        free = charging_points[active] - current[active]
+        has_free = free > 0
+        free_slots = np.cumsum(free[has_free])
+        n_served = min(int(free_slots[-1]) if len(free_slots) else 0, len(bucket))
+        assigned_sorted[bucket[:n_served]] = active[has_free][np.searchsorted(free_slots, np.arange(n_served),
+                                                                              side="right")]
+
+        # all points are taken at this time step, every remaining event gets a new charging point
+        overflow = bucket[n_served:]
+        locs = np.empty(0, dtype=np.int64)
+        if len(overflow):
+            locs = sampler.draw_many(len(overflow))
+            assigned_sorted[overflow] = locs
+            add_points(charging_points, average_capacity, locs, sorted_capacities[overflow])
+            active = np.union1d(active, locs)
+
+        # Events ohne Dauer: kleinster Standort mit Ladepunkt inklusive der bis dahin neu gebauten
+        if len(untimed):
+            lowest = np.minimum.accumulate(np.r_[lowest_active, locs])
+            assigned_sorted[untimed] = lowest[np.searchsorted(overflow, untimed)]
+
+        np.add.at(current, assigned_sorted[bucket], 1)
+
+    assigned = np.empty(n_events, dtype=np.int64)
+    assigned[order] = assigned_sorted
+    store = AvailabilityStore.from_intervals(n_locations, horizon, assigned, starts, ends)
+    return assigned, charging_points, average_capacity, store
+
+
+def _print_progress(idx: int, n_events: int):
+    if n_events > 10000 and idx % (n_events // 10000 + 1) == 0:
+        percent = (idx + 1) / n_events * 100
+        print(f"\rProgress: {percent:.2f}%", end='', flush=True)
+
+
+def place_fill_existing_first(sampler: WeightedSampler, starts: np.ndarray, ends: np.ndarray,
+                              capacities: np.ndarray, horizon: int, backend: str = "numpy"):
+    """
+    Assign events in order to the first location with a free charging point, else build a new point
+    at a randomly drawn location.
+
+    :return: assigned location per event, charging points and average capacity per location and the
+        AvailabilityStore of the occupancy
+    """
+    n_locations = len(sampler)
+    n_events = len(starts)
+
+    if resolve_backend(backend) == "numba":
+        # the k-th new charging point uses the k-th draw, like sampler.draw() in the loop below
+        assigned, charging_points, average_capacity, occupancy, locations = _fill_existing_first_kernel(
+            starts, ends, capacities, sampler.draw_many(n_events), n_locations, max(horizon, 1)
+        )
+        return assigned, charging_points, average_capacity, AvailabilityStore.from_columns(
+            n_locations, occupancy, locations)
+
+    store = AvailabilityStore(n_locations, horizon)
+    engine = CapacityEngine(store, sorted_starts=bool(np.all(np.diff(starts) >= 0)))
+    average_capacity = np.zeros(n_locations, dtype=float)
+    assigned = np.empty(n_events, dtype=np.int64)
+
+    if np.any(starts >= ends):
+        print("Fehler bei übergebener Maske zur Übertragung von Ladeevents")
+
+    for idx, (start, end, capacity) in enumerate(zip(starts.tolist(), ends.tolist(), capacities.tolist())):
+        loc = engine.first_free(start, end)
+        if loc >= 0:
+            engine.occupy(loc, start, end)
+        else:
+            loc = sampler.draw()
+            # Increase number of charging points
+            prev_count = int(engine.charging_points[loc])
+            average_capacity[loc] = (average_capacity[loc] * prev_count + capacity) / (prev_count + 1)
+            engine.add_point(loc, start, end)
+        assigned[idx] = loc
+        _print_progress(idx, n_events)
+
+    return assigned, engine.charging_points, average_capacity, store
+
+
+def place_fill_existing_only(store: AvailabilityStore, charging_points: np.ndarray, starts: np.ndarray,
+                             durations: np.ndarray, energies: np.ndarray, capacities: np.ndarray,
+                             max_shift_steps: int, simulation_steps: int, backend: str = "numpy"):
+    """
+    Assign events to existing charging points only, shifting the start by up to `max_shift_steps`.
+
+    A location counts as free if the summed occupancy over the event window is below its number of
+    charging points. The duration of a shifted event shrinks with the shift, but not below the time
+    needed to charge its energy. All shifts of an event are checked at once with prefix sums over the
+    event's time slice; the earliest feasible shift wins, then the lowest free location. `store` is
+    updated in place.
+
+    :return: assigned location per event (-1 if none is free), start and duration per event
+    """
+    n_events = len(starts)
+    assigned = np.full(n_events, -1, dtype=np.int64)
+    new_starts = np.array(starts, dtype=np.int64)
+    new_durations = np.array(durations, dtype=np.int64)
+    for loc in np.flatnonzero(charging_points > 0):
+        store.activate(loc)
+    store.reserve(int(charging_points.max()) if len(charging_points) else 0)
+    column_points = charging_points[store.active_locations]
+
+    if resolve_backend(backend) == "numba":
+        store.ensure_horizon(simulation_steps)
+        return _fill_existing_only_kernel(
+            store.window(0, store.horizon), store.active_locations.copy(), column_points.astype(np.int64),
+            new_starts, new_durations, np.asarray(energies, dtype=float), np.asarray(capacities, dtype=float),
+            max_shift_steps, simulation_steps
+        )
+
+    # alle Verschiebungen eines Events werden gemeinsam über Präfixsummen des Zeitfensters geprüft
+    shifts = np.arange(max_shift_steps + 1, dtype=np.int64)
+    for idx, (original_start, base_duration, energy, capacity) in enumerate(
+            zip(starts.tolist(), durations.tolist(), energies.tolist(), capacities.tolist())):
+        shift_starts, shift_durations = _shifted_windows(original_start, base_duration, energy, capacity, shifts)
+        shift_ends = shift_starts + shift_durations
+        valid = shift_ends <= simulation_steps  # Don't assign if end exceeds simulation time
+        if not valid.any():
+            continue
+        shift_starts, shift_durations, shift_ends = shift_starts[valid], shift_durations[valid], shift_ends[valid]
+
+        first, last = original_start, int(shift_ends.max())
+        store.ensure_horizon(last)
+        prefix = np.zeros((last - first + 1, store.n_columns), dtype=np.int64)
+        np.cumsum(store.window(first, last), axis=0, out=prefix[1:])
+        free_mask = prefix[shift_ends - first] - prefix[shift_starts - first] < column_points
+
+        feasible = free_mask.any(axis=1)
+        if feasible.any():
+            k = int(feasible.argmax())  # earliest shift with a free location
+            loc = int(store.active_locations[free_mask[k]].min())
+            start, duration = int(shift_starts[k]), int(shift_durations[k])
+            store.add(loc, start, start + duration)
+            assigned[idx] = loc
+            new_starts[idx] = start
+            new_durations[idx] = duration
+
+    return assigned, new_starts, new_durations
+
+
+def _shifted_windows(original_start, base_duration, energy, capacity, shifts):
+    """Start and duration of an event for every shift, the duration does not drop below the charging time."""
+    min_duration = energy / capacity * 4
+    shifted_durations = base_duration - shifts
+    durations = np.where(shifted_durations < min_duration,
+                         min(math.ceil(min_duration), base_duration), shifted_durations)
+    return original_start + shifts, durations
+
+
+def _fill_existing_first_kernel(starts, ends, capacities, draws, n_locations, horizon):
+    """Loop version of place_fill_existing_first for the numba backend, draws are pre-drawn locations."""
+    n_events = len(starts)
+    charging_points = np.zeros(n_locations, np.int64)
+    average_capacity = np.zeros(n_locations, np.float64)
+    column = np.full(n_locations, -1, np.int64)
+    occupancy = np.zeros((horizon, 16), np.int32)
+    locations = np.empty(16, np.int64)  # location of every column
+    order = np.empty(16, np.int64)  # columns sorted by location
+    n_columns = 0
+    n_draws = 0
+    assigned = np.empty(n_events, np.int64)
+
+    for idx in range(n_events):
+        start = starts[idx]
+        end = ends[idx]
+
+        # first location in index order without full occupancy in [start, end)
+        loc = -1
+        for k in range(n_columns):
+            col = order[k]
+            points = charging_points[locations[col]]
+            free = True
+            for t in range(start, end):
+                if occupancy[t, col] >= points:
+                    free = False
+                    break
+            if free:
+                loc = locations[col]
+                break
+
+        if loc < 0:
+            loc = draws[n_draws]
+            n_draws += 1
+            prev_count = charging_points[loc]
+            average_capacity[loc] = (average_capacity[loc] * prev_count + capacities[idx]) / (prev_count + 1)
+            charging_points[loc] += 1
+            if column[loc] < 0:
+                if n_columns == occupancy.shape[1]:
+                    grown = np.zeros((horizon, 2 * n_columns), np.int32)
+                    grown[:, :n_columns] = occupancy
+                    occupancy = grown
+                    locations = np.concatenate((locations, np.empty(n_columns, np.int64)))
+                    order = np.concatenate((order, np.empty(n_columns, np.int64)))
+                col = n_columns
+                column[loc] = col
+                locations[col] = loc
+                k = n_columns
+                while k > 0 and locations[order[k - 1]] > loc:
+                    order[k] = order[k - 1]
+                    k -= 1
+                order[k] = col
+                n_columns += 1
+
+        col = column[loc]
+        for t in range(start, end):
+            occupancy[t, col] += 1
+        assigned[idx] = loc
+
+    return assigned, charging_points, average_capacity, occupancy[:, :n_columns], locations[:n_columns]
+
+
+def _fill_existing_only_kernel(occupancy, column_locations, column_points, starts, durations, energies,
+                               capacities, max_shift_steps, simulation_steps):
+    """Loop version of place_fill_existing_only for the numba backend, `occupancy` is updated in place."""
+    n_events = len(starts)
+    n_columns = len(column_locations)
+    order = np.argsort(column_locations)
+    assigned = np.full(n_events, -1, np.int64)
+    new_starts = starts.copy()
+    new_durations = durations.copy()
+
+    for idx in range(n_events):
+        base_duration = durations[idx]
+        charge_steps = energies[idx] / capacities[idx] * 4
+        for shift in range(0, max_shift_steps + 1):
+            start = starts[idx] + shift
+            if base_duration - shift < charge_steps:
+                duration = min(math.ceil(charge_steps), base_duration)
+            else:
+                duration = base_duration - shift
+            end = start + duration
+            if end > simulation_steps:
+                continue
+
+            found = -1
+            for k in range(n_columns):
+                col = order[k]
+                points = column_points[col]
+                if points <= 0:
+                    continue
+                total = 0
+                free = True
+                for t in range(start, end):
+                    total += np.int64(occupancy[t, col])
+                    if total >= points:
+                        free = False
+                        break
+                if free:
+                    found = col
+                    break
+
+            if found >= 0:
+                for t in range(start, end):
+                    occupancy[t, found] += 1
+                assigned[idx] = column_locations[found]
+                new_starts[idx] = start
+                new_durations[idx] = duration
+                break
+
+    return assigned, new_starts, new_durations
+
+
+if njit is not None:
+    _fill_existing_first_kernel = njit(cache=True)(_fill_existing_first_kernel)
+    _fill_existing_only_kernel = njit(cache=True)(_fill_existing_only_kernel)
+
+
+def resolve_backend(backend: str) -> str:
+    """Check the name of the distribution backend, numba falls back to numpy if it is not installed."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown distribution backend '{backend}', choose one of {BACKENDS}.")
+    if backend == "numba" and njit is None:
+        print("numba is not installed, falling back to the numpy distribution backend")
+        return "numpy"
+    return backend
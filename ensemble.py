@@ -0,0 +1,109 @@
+"""
+Monte Carlo ensemble of the use cases.
+
+The input data is parsed once and sent to every worker process once. Member k runs all use cases with
+random_seed + k, so every member can be reproduced by a single run with that seed. The results of all
+members are aggregated to mean, standard deviation and percentiles per use case and per location.
+"""
+import pathlib
+
+import numpy as np
+import pandas as pd
+
+import scheduler
+import use_case_helpers as uc_helpers
+
+METRICS = ["charging_points", "energy", "installed_power"]
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def member_data(data_dict, seed, result_dir):
+    """Copy of data_dict for one member: own seed, own result dir, home events split with the new seed."""
+    seed_sequence = np.random.SeedSequence(seed)
+    member = dict(data_dict, seed=seed, seed_sequence=seed_sequence, result_dir=result_dir, results_summary={},
+                  random_seed=uc_helpers.rng_stream(seed_sequence, "input"))
+    if member["run_home"]:
+        member["charging_event"] = uc_helpers.split_home_events(member["charging_event"].copy(), member)
+    return member
+
+
+def run_member(data_dict, seed, result_dir):
+    """
+    Run all use cases for one seed.
+
+    :return: summary per use case and charging points, energy and installed power per location, both as
+        tidy DataFrames with a column 'seed'
+    """
+    result_dir.mkdir(exist_ok=True, parents=True)
+    member = member_data(data_dict, seed, result_dir)
+
+    locations, energies = [], []
+
+    def collect(data, uc, dataset_name):
+        if dataset_name == "charging-locations":
+            locations.append(pd.DataFrame({
+                "use_case": uc,
+                "location_id": data["location_id"].values,
+                "charging_points": data["charging_points"].values,
+                "installed_power": (data["charging_points"] * data["average_charging_capacity"]).values,
+            }))
+        elif dataset_name == "charging-events":
+            energy = data.groupby("location_id")["energy"].sum()
+            energies.append(pd.DataFrame({"use_case": uc, "location_id": energy.index, "energy": energy.values}))
+
+    member["on_save"] = collect
+    summary = scheduler.run(member, max_workers=1)
+
+    summary = pd.DataFrame.from_dict(summary, orient="index", columns=METRICS).rename_axis("use_case")
+    summary = summary.reset_index()
+    per_location = pd.merge(pd.concat(locations, ignore_index=True), pd.concat(energies, ignore_index=True),
+                            on=["use_case", "location_id"], how="outer").fillna(0)
+    summary.insert(0, "seed", seed)
+    per_location.insert(0, "seed", seed)
+    return summary, per_location[["seed", "use_case", "location_id"] + METRICS]
+
+
+def aggregate(members, keys):
+    """
+    Mean, standard deviation and percentiles of METRICS over the seeds, grouped by `keys`.
+    A combination of `keys` missing for a seed (e.g. a location without charging points) counts as 0.
+    """
+    n_seeds = members["seed"].nunique()
+    values = members.set_index(["seed"] + keys)[METRICS].unstack("seed", fill_value=0)
+    values = values.stack("seed", future_stack=True).fillna(0)
+    long = values.reset_index().melt(id_vars=["seed"] + keys, value_vars=METRICS, var_name="metric")
+
+    grouped = long.groupby(keys + ["metric"], sort=True)["value"]
+    stats = grouped.agg(["mean", "std"])
+    for q in PERCENTILES:
+        stats[f"p{q}"] = grouped.quantile(q / 100)
+    stats.insert(0, "n_seeds", n_seeds)
+    return stats.reset_index()
+
+
+def run(data_dict, n_members, max_workers=1):
+    """
+    Run `n_members` seeds starting at data_dict["seed"] and write the results to data_dict["result_dir"]:
+    ensemble_members.csv (summary of every seed), ensemble_summary.csv (statistics per use case) and
+    ensemble_locations.csv (statistics per location). The outputs of seed s are written to seed_<s>.
+    """
+    result_dir = pathlib.Path(data_dict["result_dir"])
+    seeds = [int(data_dict["seed"]) + k for k in range(n_members)]
+    result_dirs = [result_dir / f"seed_{seed}" for seed in seeds]
+
+    if max_workers <= 1 or n_members <= 1:
+        results = [run_member(data_dict, seed, member_dir) for seed, member_dir in zip(seeds, result_dirs)]
+    else:
+        with scheduler.make_pool(data_dict, min(max_workers, n_members)) as pool:
+            futures = [scheduler.submit(pool, run_member, seed, member_dir)
+                       for seed, member_dir in zip(seeds, result_dirs)]
+            results = [future.result() for future in futures]
+
+    summaries = pd.concat([summary for summary, _ in results], ignore_index=True)
+    per_location = pd.concat([locations for _, locations in results], ignore_index=True)
+
+    summaries.to_csv(result_dir / "ensemble_members.csv", index=False)
+    aggregate(summaries, ["use_case"]).to_csv(result_dir / "ensemble_summary.csv", index=False)
+    aggregate(per_location, ["use_case", "location_id"]).to_csv(result_dir / "ensemble_locations.csv", index=False)
+    print(f"--- ensemble of {n_members} seeds done ---")
+    return summaries
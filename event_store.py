@@ -0,0 +1,67 @@
+"""
+Charging events partitioned by charging use case, location and vehicle type.
+
+The partitions are built once after parsing and hold the row positions of every value. A selection
+intersects the positions of the requested values instead of scanning the whole table with string masks.
+The rows keep the order and index of the event table, so select(...) gives the same frame as the
+equivalent .loc[mask]. Like .loc[mask] it copies the matching rows (one take), it is not a view.
+"""
+import numpy as np
+import pandas as pd
+
+PARTITION_COLUMNS = ("charging_use_case", "location", "Type")
+
+
+class EventStore:
+    def __init__(self, events: pd.DataFrame):
+        self.events = events
+        self.partitions = {column: self._partition(events[column]) for column in PARTITION_COLUMNS
+                           if column in events.columns}
+
+    @staticmethod
+    def _partition(values: pd.Series):
+        """dict value -> sorted row positions"""
+        categorical = values.astype("category") if not isinstance(values.dtype, pd.CategoricalDtype) else values
+        codes = categorical.cat.codes.values
+        order = np.argsort(codes, kind="stable")
+        counts = np.bincount(codes[codes >= 0], minlength=len(categorical.cat.categories))
+        start = int((codes < 0).sum())  # fehlende Werte liegen vorne
+        bounds = start + np.concatenate(([0], np.cumsum(counts)))
+        return {value: order[bounds[i]:bounds[i + 1]] for i, value in enumerate(categorical.cat.categories)}
+
+    def _rows(self, column, values):
+        if isinstance(values, str):
+            values = [values]
+        partition = self.partitions[column]
+        rows = [partition[value] for value in values if value in partition]
+        if len(rows) == 1:
+            return rows[0]
+        return np.flatnonzero(self._marks(rows))
+
+    def _marks(self, rows):
+        marks = np.zeros(len(self.events), dtype=bool)
+        for partition_rows in rows:
+            marks[partition_rows] = True
+        return marks
+
+    def positions(self, exclude: dict = None, **criteria):
+        """
+        Row positions of the events matching all criteria (column=value or column=[values]), without the
+        events matching any of `exclude`, in the order of the event table.
+        """
+        result = None
+        for column, values in criteria.items():
+            rows = self._rows(column, values)
+            result = rows if result is None else result[self._marks([rows])[result]]
+        if result is None:
+            result = np.arange(len(self.events))
+        for column, values in (exclude or {}).items():
+            result = result[~self._marks([self._rows(column, values)])[result]]
+        return result
+
+    def select(self, exclude: dict = None, **criteria) -> pd.DataFrame:
+        """Events matching the criteria (see positions) as a new frame, with the index of the event table."""
+        return self.events.take(self.positions(exclude, **criteria))
+
+    def is_current(self, events: pd.DataFrame):
+        return self.events is events
@@ -0,0 +1,120 @@
+"""
+Content-addressed cache of parsed input layers.
+
+A layer is stored as GeoParquet under a key built from the content hashes of its source files and the
+config values it depends on. If a source file or one of these values changes, the key changes and the
+layer is built again. Every keyed version is kept, so switching between configs reuses the earlier
+builds; entries not used for a while are removed explicitly with prune(). The hash of a source file is
+only recomputed if its size or modification time changed.
+"""
+import hashlib
+import json
+import os
+import pathlib
+import tempfile
+import time
+
+import geopandas as gpd
+
+HASH_INDEX = "file_hashes.json"
+KEY_LENGTH = 20
+
+
+def _write_atomic(path, write):
+    """Write to a temporary file next to `path` and move it in place, so parallel runs never see half files."""
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix=".tmp")
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def file_hash(path, cache_dir):
+    """SHA-256 of the file content, reused from the hash index of `cache_dir` while size and mtime match."""
+    path = pathlib.Path(path).resolve()
+    index_path = pathlib.Path(cache_dir, HASH_INDEX)
+    try:
+        index = json.loads(index_path.read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        index = {}
+
+    stat = path.stat()
+    entry = index.get(str(path))
+    if entry is not None and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+        return entry["sha256"]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+
+    index[str(path)] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest.hexdigest()}
+    _write_atomic(index_path, lambda tmp: pathlib.Path(tmp).write_text(json.dumps(index, indent=1)))
+    return digest.hexdigest()
+
+
+def cache_key(name, sources, params, cache_dir):
+    key = {
+        "name": name,
+        "sources": [file_hash(source, cache_dir) for source in sources],
+        "params": params,
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()[:KEY_LENGTH]
+
+
+def load(cache_dir, name, sources, build, **params):
+    """
+    Return the layer `name`, read from the cache or built with `build()` and stored.
+
+    :param cache_dir: cache directory, None disables the cache
+    :param sources: files the layer is read from
+    :param build: function without arguments that builds the layer (GeoDataFrame)
+    :param params: config values the layer depends on
+    """
+    if cache_dir is None:
+        return build()
+
+    cache_dir = pathlib.Path(cache_dir)
+    cache_dir.mkdir(exist_ok=True, parents=True)
+    path = cache_dir / f"{name}_{cache_key(name, sources, params, cache_dir)}.parquet"
+
+    try:
+        # Zeitpunkt der letzten Nutzung für prune()
+        os.utime(path)
+        layer = gpd.read_parquet(path)
+        print(f"--- loading {name} from cache ---")
+        return layer
+    except FileNotFoundError:
+        # noch nicht gebaut oder inzwischen von prune() eines anderen Laufs entfernt
+        pass
+
+    layer = build()
+    _write_atomic(path, lambda tmp: layer.to_parquet(tmp, compression="zstd"))
+    return layer
+
+
+def prune(cache_dir, max_age_days):
+    """
+    Remove cached layers that were not used for more than `max_age_days` days.
+
+    Loading a layer updates its modification time, so the layers of a running scenario are never removed.
+    :return: number of removed layers
+    """
+    if cache_dir is None or not max_age_days > 0:
+        return 0
+    cache_dir = pathlib.Path(cache_dir)
+    limit = time.time() - max_age_days * 86400
+    removed = 0
+    for path in cache_dir.glob(f"*_{'?' * KEY_LENGTH}.parquet"):
+        try:
+            if path.stat().st_mtime < limit:
+                path.unlink()
+                removed += 1
+        except FileNotFoundError:
+            pass
+    if removed:
+        print(f"--- removed {removed} unused layers from the cache ---")
+    return removed
@@ -0,0 +1,164 @@
+"""
+Dependency-aware execution of the use cases.
+
+Every use case is one task. Public depends on the multi-use output of retail or work if the multi-use
+concept is active, all other use cases only read their own slice of the input data and can run side by
+side in a process pool.
+"""
+import concurrent.futures as cf
+
+import event_store
+import use_case as uc
+import use_case_helpers as uc_helpers
+import utility
+
+SUMMARY_KEYS = ("charging_points", "energy", "installed_power")
+
+# data dict of a worker process, set once by the pool initializer
+_worker_data = None
+
+
+def build_tasks(data_dict):
+    """
+    Build the dependency graph of the use cases to run.
+
+    :return: dict task -> tuple of tasks it depends on, in the order of a serial run
+    """
+    tasks = {}
+    if data_dict["run_home"]:
+        tasks["home_detached"] = ()
+        tasks["home_apartment"] = ()
+    if data_dict["run_work"]:
+        tasks["work"] = ()
+    if data_dict["run_hpc"]:
+        tasks["hpc"] = ()
+    if data_dict["run_retail"]:
+        tasks["retail"] = ()
+    if data_dict["run_public"]:
+        if data_dict["multi_use_concept"]:
+            host = data_dict["use_case_multi_use"]
+            if host not in tasks:
+                raise ValueError(f"multi_use_concept needs the use case '{host}' (use_case_multi_use) to run.")
+            tasks["public"] = (host,)
+        else:
+            tasks["public"] = ()
+    if data_dict["run_depot"]:
+        tasks["depot"] = ()
+    return tasks
+
+
+def run_task(data_dict, task, *dependencies):
+    """
+    Run a single use case.
+
+    :param dependencies: multi-use events returned by the tasks `task` depends on
+    :return: summary entries {name: {charging_points, energy, installed_power}} and the multi-use events
+        handed on to public (None for all other use cases)
+    """
+    # eigener Zufallsstrom je Use-Case, unabhängig davon, in welchem Prozess und wann er läuft
+    data_dict = dict(data_dict, random_seed=uc_helpers.rng_stream(data_dict["seed_sequence"], task))
+    multi_use_host = data_dict["multi_use_concept"] and data_dict["use_case_multi_use"] == task
+    multi_use_events = None
+
+    if task in ("home_detached", "home_apartment"):
+        mode = task.split("_")[1]
+        results = {task: uc.home(data_dict[task.replace("home", "home_data")], data_dict, mode=mode)}
+    elif task == "work" and multi_use_host:
+        output = uc.work(data_dict["work"], data_dict, office_data=data_dict["office_parking_data"])
+        results = {"work_office": output[0:3], "work_not_office": output[3:6]}
+        multi_use_events = output[6]
+    elif task == "work":
+        results = {task: uc.work(data_dict["work"], data_dict)}
+    elif task == "hpc":
+        results = {task: uc.hpc(data_dict["hpc_points"], data_dict)}
+    elif task == "retail" and multi_use_host:
+        output = uc.retail(data_dict["retail_parking_lots"], data_dict)
+        results = {task: output[0:3]}
+        multi_use_events = output[3]
+    elif task == "retail":
+        results = {task: uc.retail(data_dict["retail_parking_lots"], data_dict)}
+    elif task == "public":
+        if data_dict["multi_use_concept"]:
+            results = {task: uc.public(data_dict["poi_data"], data_dict["home_street_data"], data_dict,
+                                       charging_locations_public_after_multi_use=dependencies[0])}
+        else:
+            results = {task: uc.public(data_dict["poi_data"], data_dict["home_street_data"], data_dict)}
+    elif task == "depot":
+        results = {task: uc.depot(data_dict["depot"], data_dict)}
+    else:
+        raise ValueError(f"Unknown use case '{task}'.")
+
+    return {name: dict(zip(SUMMARY_KEYS, values)) for name, values in results.items()}, multi_use_events
+
+
+def _init_worker(data_dict):
+    global _worker_data
+    _worker_data = data_dict
+
+
+def _run_in_worker(function, *args):
+    result = function(_worker_data, *args)
+    # Ergebnistabellen im Worker fertig schreiben, Fehler gehen so an den Hauptprozess
+    utility.flush_results()
+    return result
+
+
+def make_pool(data_dict, max_workers):
+    """Process pool whose workers receive data_dict once, fill it with submit()."""
+    return cf.ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(data_dict,))
+
+
+def submit(pool, function, *args):
+    """
+    Run function(data_dict, *args) in a worker of a pool from make_pool, with the data_dict of the worker.
+    `function` has to be a module level function so it can be pickled.
+    """
+    return pool.submit(_run_in_worker, function, *args)
+
+
+def run(data_dict, max_workers=1, only=None):
+    """
+    Run all configured use cases and fill data_dict["results_summary"].
+
+    With max_workers > 1 independent use cases run in a process pool, a use case is started as soon as
+    the use cases it depends on are done. The input data is sent to every worker once. The summary keeps
+    the order of a serial run regardless of the order in which the use cases finish.
+
+    :param only: run only these use cases, their dependencies have to be included
+    """
+    tasks = build_tasks(data_dict)
+    # Partitionen der Ladeevents neu bilden, falls die Events ersetzt wurden (z.B. Ensemble, Sweep)
+    store = data_dict.get("event_store")
+    if store is None or not store.is_current(data_dict["charging_event"]):
+        data_dict["event_store"] = event_store.EventStore(data_dict["charging_event"])
+    if only is not None:
+        tasks = {task: dependencies for task, dependencies in tasks.items() if task in only}
+        missing = {d for dependencies in tasks.values() for d in dependencies} - set(tasks)
+        if missing:
+            raise ValueError(f"Use cases {sorted(missing)} are needed but not selected.")
+    summaries = {}
+    multi_use_events = {}
+
+    if max_workers <= 1 or len(tasks) <= 1:
+        for task, dependencies in tasks.items():
+            summaries[task], multi_use_events[task] = run_task(
+                data_dict, task, *[multi_use_events[d] for d in dependencies])
+    else:
+        waiting = dict(tasks)
+        running = {}
+        with make_pool(data_dict, min(max_workers, len(tasks))) as pool:
+            while waiting or running:
+                for task, dependencies in list(waiting.items()):
+                    if all(d in summaries for d in dependencies):
+                        future = submit(pool, run_task, task, *[multi_use_events[d] for d in dependencies])
+                        running[future] = task
+                        del waiting[task]
+                done, _ = cf.wait(running, return_when=cf.FIRST_COMPLETED)
+                for future in done:
+                    task = running.pop(future)
+                    summaries[task], multi_use_events[task] = future.result()
+                    print(f"--- use case {task} done ---")
+
+    for task in tasks:
+        data_dict["results_summary"].update(summaries[task])
+    return data_dict["results_summary"]
@@ -0,0 +1,179 @@
+"""
+Parameter sweep over config values on one parsed input.
+
+A sweep spec is a cfg file with a [sweep] section. 'mode = grid' runs all combinations of the listed
+values, 'mode = list' combines the i-th values of all parameters to variant i:
+
+    [sweep]
+    mode = grid
+    flexibility_multi_use = 0, 24, 48
+    share_office_parking = 0.2, 0.4
+
+Every parameter only touches some stages of the tool. Use cases no swept parameter touches run once and
+are shared by all variants, the other use cases (and their dependencies) run once per variant. All jobs
+run in a process pool that gets the parsed input once.
+"""
+import configparser as cp
+import itertools
+import pathlib
+
+import pandas as pd
+
+import scheduler
+import use_case_helpers as uc_helpers
+
+# Parameter: (Typ, betroffene Stufen)
+PARAMETERS = {
+    "flexibility_multi_use": (int, {"multi_use"}),
+    "share_office_parking": (float, {"work"}),
+    "share_home_detached": (float, {"home_split"}),
+    "share_home_apartment": (float, {"home_split"}),
+    "charging_time_limit": (bool, {"time_limit"}),
+    "charging_time_limit_duration": (int, {"time_limit"}),
+    "charging_time_limit_start": (int, {"time_limit"}),
+    "charging_time_limit_end": (int, {"time_limit"}),
+}
+
+SUMMARY_ORDER = ["home_detached", "home_apartment", "work", "work_office", "work_not_office", "hpc", "retail",
+                 "public", "depot"]
+
+
+def read_spec(path):
+    """
+    Read a sweep spec.
+
+    :return: list of variants, each a dict parameter -> value
+    """
+    parser = cp.ConfigParser()
+    if not parser.read(path):
+        raise FileNotFoundError(f'Sweep file {path} not found.')
+    section = parser["sweep"]
+    mode = section.get("mode", "grid")
+
+    values = {}
+    for parameter in section:
+        if parameter == "mode":
+            continue
+        if parameter not in PARAMETERS:
+            raise ValueError(f"Parameter '{parameter}' can not be swept, choose from {sorted(PARAMETERS)}.")
+        dtype = PARAMETERS[parameter][0]
+        raw = [v.strip() for v in section[parameter].split(",")]
+        if dtype is bool:
+            values[parameter] = [cp.ConfigParser.BOOLEAN_STATES[v.lower()] for v in raw]
+        else:
+            values[parameter] = [dtype(v) for v in raw]
+
+    if mode == "grid":
+        combinations = itertools.product(*values.values())
+    elif mode == "list":
+        if len({len(v) for v in values.values()}) > 1:
+            raise ValueError("All parameters of a list sweep need the same number of values.")
+        combinations = zip(*values.values())
+    else:
+        raise ValueError(f"Unknown sweep mode '{mode}', choose grid or list.")
+    return [dict(zip(values, combination)) for combination in combinations]
+
+
+def swept_stages(variants):
+    return {stage for variant in variants for parameter in variant for stage in PARAMETERS[parameter][1]}
+
+
+def affected_tasks(data_dict, stages):
+    """Use cases that have to run per variant if `stages` change, including their dependencies."""
+    tasks = scheduler.build_tasks(data_dict)
+    host = data_dict["use_case_multi_use"] if data_dict["multi_use_concept"] else None
+
+    affected = set()
+    if "home_split" in stages:
+        affected |= {"home_detached", "home_apartment"}
+    if "work" in stages:
+        affected.add("work")
+    if "multi_use" in stages and host is not None:
+        affected.add(host)
+    if "time_limit" in stages:
+        # park_time_limitation ändert nur street-Events, die public und der Multi-Use-Host nutzen
+        affected |= {"public", host}
+
+    # abhängige Use-Cases und deren Abhängigkeiten laufen mit
+    for task, dependencies in tasks.items():
+        if affected & set(dependencies):
+            affected.add(task)
+    for task in list(affected & set(tasks)):
+        affected |= set(tasks[task])
+    return {task for task in tasks if task in affected}
+
+
+def variant_data(data_dict, variant, stages, result_dir):
+    """Copy of data_dict with the values of `variant` and the charging events of the variant."""
+    data = dict(data_dict, **variant, result_dir=result_dir, results_summary={})
+    # die Anteile home_apartment und home_detached ergänzen sich zu 1
+    if "share_home_detached" in variant and "share_home_apartment" not in variant:
+        data["share_home_apartment"] = 1 - variant["share_home_detached"]
+    elif "share_home_apartment" in variant and "share_home_detached" not in variant:
+        data["share_home_detached"] = 1 - variant["share_home_apartment"]
+
+    events = data["charging_event"]
+    if "home_split" in stages and data["run_home"]:
+        # gleicher Eingabe-Strom wie beim Einlesen, gleiche Anteile ergeben die gleiche Aufteilung
+        data["random_seed"] = uc_helpers.rng_stream(data["seed_sequence"], "input")
+        events = uc_helpers.split_home_events(events.copy(), data)
+    if "time_limit" in stages and data["charging_time_limit"]:
+        events = uc_helpers.park_time_limitation(events.copy(), data, "street")
+    data["charging_event"] = events
+    return data
+
+
+def run_job(data_dict, variant, stages, tasks, result_dir):
+    """Run `tasks` for one variant (None: the shared use cases with the base config)."""
+    result_dir.mkdir(exist_ok=True, parents=True)
+    if variant is None:
+        data = dict(data_dict, result_dir=result_dir, results_summary={})
+    else:
+        data = variant_data(data_dict, variant, stages, result_dir)
+    return scheduler.run(data, max_workers=1, only=tasks)
+
+
+def run(data_dict, variants, max_workers=1):
+    """
+    Run all variants and write sweep_summary.csv to data_dict["result_dir"], one row per variant and use case.
+
+    `data_dict` has to hold the charging events without time limit if a time limit parameter is swept.
+    Outputs of the shared use cases are written to shared/, those of variant i to variant_<i>/.
+    """
+    result_dir = pathlib.Path(data_dict["result_dir"])
+    stages = swept_stages(variants)
+    per_variant = affected_tasks(data_dict, stages)
+    shared = set(scheduler.build_tasks(data_dict)) - per_variant
+    print(f"--- sweep: {len(variants)} variants, per variant: {sorted(per_variant)}, shared: {sorted(shared)} ---")
+
+    jobs = []
+    if shared:
+        jobs.append((None, stages, shared, result_dir / "shared"))
+    if per_variant:
+        jobs += [(variant, stages, per_variant, result_dir / f"variant_{i}") for i, variant in enumerate(variants)]
+
+    if max_workers <= 1 or len(jobs) <= 1:
+        results = [run_job(data_dict, *job) for job in jobs]
+    else:
+        with scheduler.make_pool(data_dict, min(max_workers, len(jobs))) as pool:
+            futures = [scheduler.submit(pool, run_job, *job) for job in jobs]
+            results = [future.result() for future in futures]
+
+    shared_summary = results[0] if shared else {}
+    variant_summaries = results[1:] if shared else results
+    if not per_variant:
+        variant_summaries = [{} for _ in variants]
+
+    rows = []
+    for i, variant in enumerate(variants):
+        for summaries, is_shared in ((shared_summary, True), (variant_summaries[i], False)):
+            for use_case, values in summaries.items():
+                rows.append({"variant": i, **variant, "use_case": use_case, "shared": is_shared, **values})
+
+    table = pd.DataFrame(rows)
+    order = {use_case: position for position, use_case in enumerate(SUMMARY_ORDER)}
+    table = table.sort_values(["variant", "use_case"], key=lambda column: column.map(order)
+                              if column.name == "use_case" else column, kind="stable")
+    table.to_csv(result_dir / "sweep_summary.csv", index=False)
+    print(f"--- sweep of {len(variants)} variants done ---")
+    return table
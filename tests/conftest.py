@@ -0,0 +1,5 @@
+import pathlib
+import sys
+
+# die Module liegen flach im Wurzelverzeichnis
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
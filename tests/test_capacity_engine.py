@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+import capacity_engine
+
+
+def events_with_zero_duration(sort, seed=3):
+    rng = np.random.default_rng(seed)
+    starts = rng.integers(0, 50, 400)
+    durations = rng.integers(0, 12, 400)
+    durations[::7] = 0
+    if sort:
+        order = np.argsort(starts, kind="stable")
+        starts, durations = starts[order], durations[order]
+    return starts, starts + durations, rng.uniform(3.7, 22, 400)
+
+
+def fill_existing_first(starts, ends, capacities, backend):
+    sampler = capacity_engine.WeightedSampler(np.arange(1, 21, dtype=float), np.random.default_rng(7))
+    assigned, charging_points, average_capacity, _ = capacity_engine.place_fill_existing_first(
+        sampler, starts, ends, capacities, int(ends.max()), backend=backend)
+    return assigned, charging_points, average_capacity
+
+
+def fill_existing_first_kernel(starts, ends, capacities):
+    # der Kernel läuft auch ohne numba, dann als Python-Funktion
+    sampler = capacity_engine.WeightedSampler(np.arange(1, 21, dtype=float), np.random.default_rng(7))
+    assigned, charging_points, average_capacity, _, _ = capacity_engine._fill_existing_first_kernel(
+        starts, ends, capacities, sampler.draw_many(len(starts)), len(sampler), int(ends.max()))
+    return assigned, charging_points, average_capacity
+
+
+@pytest.mark.parametrize("sort", [False, True], ids=["unsorted", "sorted"])
+def test_zero_duration_events_same_in_numpy_and_kernel(sort):
+    starts, ends, capacities = events_with_zero_duration(sort)
+
+    expected = fill_existing_first_kernel(starts, ends, capacities)
+    result = fill_existing_first(starts, ends, capacities, "numpy")
+
+    for expected_values, values in zip(expected, result):
+        np.testing.assert_array_equal(values, expected_values)
+
+
+@pytest.mark.parametrize("sort", [False, True], ids=["unsorted", "sorted"])
+def test_zero_duration_events_same_in_both_backends(sort):
+    pytest.importorskip("numba")
+    starts, ends, capacities = events_with_zero_duration(sort)
+
+    for expected_values, values in zip(fill_existing_first(starts, ends, capacities, "numba"),
+                                       fill_existing_first(starts, ends, capacities, "numpy")):
+        np.testing.assert_array_equal(values, expected_values)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_zero_duration_events_same_in_bucketed_and_sequential(seed):
+    starts, ends, capacities = events_with_zero_duration(True, seed)
+    # die ersten Events ohne Dauer, bevor es einen Ladepunkt gibt
+    ends[:3] = starts[:3]
+
+    results = []
+    for place in (capacity_engine.place_fill_existing_first, capacity_engine.place_bucketed):
+        sampler = capacity_engine.WeightedSampler(np.arange(1, 21, dtype=float), np.random.default_rng(7))
+        results.append(place(sampler, starts, ends, capacities, int(ends.max()))[:3])
+
+    for expected_values, values in zip(*results):
+        np.testing.assert_array_equal(values, expected_values)
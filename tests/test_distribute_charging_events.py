@@ -0,0 +1,39 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+
+import use_case_helpers as uc_helpers
+
+
+def no_events():
+    return pd.DataFrame({"event_start": np.array([], dtype="int32"), "event_time": np.array([], dtype="int32"),
+                         "station_charging_capacity": np.array([], dtype=float)})
+
+
+@pytest.mark.parametrize("weights", [[], [0.0, 0.0]], ids=["no_locations", "zero_weights"])
+@pytest.mark.parametrize("options", [
+    {},
+    {"backend": "numba"},
+    {"assignment_mode": "bucketed"},
+    {"assignment_mode": "bucketed_relaxed"},
+    {"fill_existing_first": False},
+], ids=["sequential", "numba", "bucketed", "bucketed_relaxed", "random"])
+def test_no_events_gives_empty_result(weights, options):
+    locations = gpd.GeoDataFrame({"weight": np.array(weights, dtype=float)},
+                                 geometry=gpd.points_from_xy(np.arange(len(weights)), np.zeros(len(weights))))
+
+    charging_locations, events = uc_helpers.distribute_charging_events(
+        locations, no_events(), "weight", 2000, rng=np.random.default_rng(1), **options)
+
+    assert len(events) == 0
+    assert len(charging_locations) == len(weights)
+    assert (charging_locations["charging_points"] == 0).all()
+
+
+def test_weights_are_checked_with_the_first_draw():
+    locations = gpd.GeoDataFrame({"weight": [0.0, 0.0]}, geometry=gpd.points_from_xy([0, 1], [0, 0]))
+    events = pd.DataFrame({"event_start": [0], "event_time": [4], "station_charging_capacity": [11.0]})
+
+    with pytest.raises(ValueError):
+        uc_helpers.distribute_charging_events(locations, events, "weight", 2000, rng=np.random.default_rng(1))
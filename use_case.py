@@ -5,7 +5,7 @@ import geopandas as gpd
 import numpy as np
 import math
 import use_case_helpers as uc_helpers
-import heapq
+import capacity_engine
 
 def hpc(hpc_data: gpd.GeoDataFrame, uc_dict, timestep=15):
     """
@@ -25,11 +25,8 @@ def hpc(hpc_data: gpd.GeoDataFrame, uc_dict, timestep=15):
     #     uc_dict["charging_event"]["charging_use_case"].isin(["urban_fast"])]
 
     charging_events = (
-        uc_dict["charging_event"]
-        .loc[
-            uc_dict["charging_event"]["charging_use_case"].isin(["urban_fast"])
-            & ~uc_dict["charging_event"]["location"].isin(["shopping"])
-        ]
+        uc_dict["event_store"]
+        .select(charging_use_case="urban_fast", exclude={"location": "shopping"})
         .reset_index()
     )
 
@@ -47,7 +44,7 @@ def hpc(hpc_data: gpd.GeoDataFrame, uc_dict, timestep=15):
             located_charging_events,
         ) = uc_helpers.distribute_charging_events(
             in_region, charging_events, weight_column="gewicht", simulation_steps=2000,
-            rng=uc_dict["random_seed"])
+            rng=uc_dict["random_seed"], backend=uc_dict["distribution_backend"], assignment_mode=uc_dict["assignment_mode"])
 
         # Merge Chargin_events and Locations
         charging_locations_hpc["index"] = charging_locations_hpc.index
@@ -66,6 +63,8 @@ def hpc(hpc_data: gpd.GeoDataFrame, uc_dict, timestep=15):
         charging_locations = charging_locations_hpc[uc_dict["columns_output_locations"]]
         located_charging_events_gdf = located_charging_events_gdf[uc_dict["columns_output_chargingevents"]]
 
+        if uc_dict["right_size_charging_points"]:
+            charging_locations = uc_helpers.right_size_charging_points(charging_locations, located_charging_events_gdf)
         charging_locations = charging_locations[charging_locations["charging_points"] != 0]
 
         utility.save(charging_locations, uc_id, "charging-locations", uc_dict)
@@ -88,11 +87,7 @@ def public(
 ):
     uc_id = "public"
     print("Use case: " + uc_id)
-    charging_events_public = (
-        uc_dict["charging_event"]
-        .loc[uc_dict["charging_event"]["charging_use_case"] == "street"]
-        .reset_index()
-    )
+    charging_events_public = uc_dict["event_store"].select(charging_use_case="street").reset_index()
 
     if uc_dict["multi_use_concept"]:
         print("multi-use-consepts activated")
@@ -102,11 +97,7 @@ def public(
         else:
             charging_events_commerical = charging_locations_public_after_multi_use.reset_index(drop=True)
 
-            charging_events_private = uc_dict["charging_event"].loc[
-                uc_dict["charging_event"]["charging_use_case"].isin(["street"]) & uc_dict["charging_event"][
-                    "Type"].isin(
-                    ["Private"])
-                ]
+            charging_events_private = uc_dict["event_store"].select(charging_use_case="street", Type="Private")
 
             charging_events = pd.concat([charging_events_private, charging_events_commerical], ignore_index=True)
     else:
@@ -131,95 +122,32 @@ def public(
         events = events.dropna(subset=["location_id", "event_start", "event_time"]).copy()
         events["event_end"] = events["event_start"] + events["event_time"]
 
-        # --- Kapazitäten je Standort (harte Obergrenze) ---
-        cap = (
-            locs.set_index("location_id")["charging_points"]
-            .fillna(0).astype(int)
-            .to_dict()
-        )
-        all_locations = list(locs["location_id"].unique())
-
-        # Aktuelle Belegung und Peaks
-        load = {lid: 0 for lid in all_locations}
-        max_load = {lid: 0 for lid in all_locations}
+        # --- Standorte als Index der sortierten location_ids (bei gleicher Belegung hat die kleinere ID Vorrang) ---
+        location_ids = pd.Index(np.unique(locs["location_id"]))
+        # Kapazitäten je Standort (harte Obergrenze)
+        capacity = np.zeros(len(location_ids), dtype=np.int64)
+        capacity[location_ids.get_indexer(locs["location_id"])] = locs["charging_points"].fillna(0).astype(int)
+        preferred = location_ids.get_indexer(events["location_id"])
 
-        # Verfügbarkeits-Heap: nur Locations mit cap>0 kommen rein
-        # (Eintrag: (current_load, location_id); lazy updates bei Änderungen)
-        availQ = [(0, lid) for lid in all_locations if cap.get(lid, 0) > 0]
-        heapq.heapify(availQ)
+        assigned, peaks = capacity_engine.reassign_with_capacity(
+            events["event_start"].to_numpy(dtype=np.int64), events["event_end"].to_numpy(dtype=np.int64),
+            preferred, capacity)
+        served = assigned >= 0
 
-        # Globale Endzeiten-Queue: (end_time, location_id)
-        endQ = []
+        # Ergebnis-Spalten
+        # nur bediente Events indizieren, ohne zusätzliche Standorte ist location_ids leer und alle sind unbedient
+        assigned_location_id = pd.Series(pd.NA, index=events.index, dtype="Int64")
+        assigned_location_id[served] = location_ids.values[assigned[served]]
+        events["assigned_location_id"] = assigned_location_id
+        events["was_reassigned"] = served & (assigned != preferred)
+        events["unserved"] = ~served
 
-        # Events sortiert nach Start (bei Gleichstand längere zuerst ist optional)
-        ev_idx = events.sort_values(by=["event_start", "event_time"], ascending=[True, False]).index
+        # Neue charging_points = beobachteter Peak je Standort
+        # (entspricht der minimal nötigen Anzahl simultaner Punkte unter Kapazitätszwang)
+        locs["charging_points"] = peaks[location_ids.get_indexer(locs["location_id"])]
 
-        # Ergebnis-Spalten
-        events["assigned_location_id"] = pd.Series(pd.NA, index=events.index, dtype="Int64")
-        events["was_reassigned"] = False
-        events["unserved"] = False
-
-        def release_finished(until_time: int):
-            """Alle Enden <= until_time verarbeiten (Last senken, availQ updaten)."""
-            while endQ and endQ[0][0] <= until_time:
-                end_t, lid = heapq.heappop(endQ)
-                load[lid] -= 1
-                # Falls nach dem Freigeben noch Kapazität frei: neuen (akt. load, lid) eintragen
-                if load[lid] < cap.get(lid, 0):
-                    heapq.heappush(availQ, (load[lid], lid))
-
-        for idx in ev_idx:
-            start = int(events.at[idx, "event_start"])
-            end = int(events.at[idx, "event_end"])
-            orig = events.at[idx, "location_id"]
-
-            # 1) Erst beendete Ladevorgänge freigeben
-            release_finished(start)
-
-            chosen = None
-
-            # 2) Bevorzugt: Originalstandort, falls dort freie Kapazität
-            if cap.get(orig, 0) > 0 and load[orig] < cap[orig]:
-                chosen = orig
-            else:
-                # 3) Sonst: Standort mit minimaler aktueller Belegung aus availQ (lazy updates)
-                while availQ:
-                    cand_load, cand = heapq.heappop(availQ)
-                    # veraltete Einträge überspringen
-                    if cand_load != load[cand]:
-                        continue
-                    # nur nehmen, wenn noch Kapazität frei
-                    if load[cand] < cap.get(cand, 0):
-                        chosen = cand
-                        break
-                # wenn keiner frei ist -> unserved
-
-            if chosen is None:
-                events.at[idx, "unserved"] = True
-                continue
-
-            # 4) Zuweisen
-            load[chosen] += 1
-            max_load[chosen] = max(max_load[chosen], load[chosen])
-            heapq.heappush(endQ, (end, chosen))
-
-            # Standort bleibt ggf. weiter verfügbar -> neuen Zustand in availQ schreiben
-            if load[chosen] < cap.get(chosen, 0):
-                heapq.heappush(availQ, (load[chosen], chosen))
-
-            events.at[idx, "assigned_location_id"] = chosen
-            events.at[idx, "was_reassigned"] = (chosen != orig)
-
-        # 5) Neue charging_points = beobachteter Peak je Standort
-        #    (entspricht der minimal nötigen Anzahl simultaner Punkte unter Kapazitätszwang)
-        peak_series = pd.Series(max_load, name="charging_points")
-        locs = locs.copy()
-        locs["charging_points"] = locs["location_id"].map(peak_series).fillna(0).astype(int)
-
-        # 6) Überschreiben der location_id nur, wenn zugewiesen (nicht für unserved)
-        mask_assigned = events["assigned_location_id"].notna()
-        events.loc[mask_assigned, "location_id"] = events.loc[mask_assigned, "assigned_location_id"].astype(
-            events["location_id"].dtype)
+        # Überschreiben der location_id nur, wenn zugewiesen (nicht für unserved)
+        events.loc[served, "location_id"] = location_ids.values[assigned[served]].astype(events["location_id"].dtype)
 
         # Outputs wie gehabt
         charging_locations = locs[locs["charging_points"] > 0].reset_index(drop=True)
@@ -270,7 +198,7 @@ def public(
             charging_events_home_street,
             weight_column="Weight",
             simulation_steps=2000,
-            rng=uc_dict["random_seed"],
+            rng=uc_dict["random_seed"], backend=uc_dict["distribution_backend"], assignment_mode=uc_dict["assignment_mode"],
             # fill_existing_only=fill_existing_only,
             fill_existing_first=True,
             additional_street_input=bool(uc_dict["additional_public_input"])
@@ -286,7 +214,7 @@ def public(
             charging_events_not_home_street,
             weight_column="Weight",
             simulation_steps=2000,
-            rng=uc_dict["random_seed"],
+            rng=uc_dict["random_seed"], backend=uc_dict["distribution_backend"], assignment_mode=uc_dict["assignment_mode"],
             #fill_existing_only=fill_existing_only,
             fill_existing_first=True,
             additional_street_input=bool(uc_dict["additional_public_input"])
@@ -347,6 +275,8 @@ def public(
             charging_locations, located_charging_events = uc_helpers.postprocess_public_demands(charging_locations,
             located_charging_events_gdf)
 
+    if uc_dict["right_size_charging_points"]:
+        charging_locations = uc_helpers.right_size_charging_points(charging_locations, located_charging_events_gdf)
     charging_locations = charging_locations[charging_locations["charging_points"] != 0]
 
     utility.save(charging_locations, uc_id, "charging-locations", uc_dict)
@@ -367,13 +297,7 @@ def home(home_data: gpd.GeoDataFrame, uc_dict, mode):
     if mode == "apartment":
         uc_id = "home_apartment"
         print("Use case: " + uc_id)
-        charging_events = (
-            uc_dict["charging_event"]
-            .loc[
-                uc_dict["charging_event"]["charging_use_case"].isin(["home_apartment"])
-            ]
-            .reset_index()
-        )
+        charging_events = uc_dict["event_store"].select(charging_use_case="home_apartment").reset_index()
         # charging_events = charging_events.iloc[:500]
         (
             charging_locations_home,
@@ -383,17 +307,13 @@ def home(home_data: gpd.GeoDataFrame, uc_dict, mode):
             charging_events,
             weight_column="households_total",
             simulation_steps=2000, fill_existing_first=True,
-            rng=uc_dict["random_seed"]
+            rng=uc_dict["random_seed"], backend=uc_dict["distribution_backend"], assignment_mode=uc_dict["assignment_mode"]
         )
 
     elif mode == "detached":
         uc_id = "home_detached"
         print("Use case: " + uc_id)
-        charging_events = (
-            uc_dict["charging_event"]
-            .loc[uc_dict["charging_event"]["charging_use_case"].isin(["home_detached"])]
-            .reset_index()
-        )
+        charging_events = uc_dict["event_store"].select(charging_use_case="home_detached").reset_index()
         # charging_events = charging_events.iloc[:500]
         (
             charging_locations_home,
@@ -403,7 +323,7 @@ def home(home_data: gpd.GeoDataFrame, uc_dict, mode):
             charging_events,
             weight_column="households_total",
             simulation_steps=2000, fill_existing_first=False,
-            rng=uc_dict["random_seed"]
+            rng=uc_dict["random_seed"], backend=uc_dict["distribution_backend"]
         )
 
     else:
@@ -430,6 +350,8 @@ def home(home_data: gpd.GeoDataFrame, uc_dict, mode):
 
     located_charging_events_gdf = located_charging_events_gdf[uc_dict["columns_output_chargingevents"]]
 
+    if uc_dict["right_size_charging_points"]:
+        charging_locations = uc_helpers.right_size_charging_points(charging_locations, located_charging_events_gdf)
     charging_locations = charging_locations[charging_locations["charging_points"] != 0]
 
     utility.save(charging_locations, uc_id, "charging-locations", uc_dict)
@@ -445,17 +367,13 @@ def work(work_data, uc_dict, office_data=None, timestep=15):
     uc_id = "work"
     print("Use case: " + uc_id)
 
-    charging_events = (
-        uc_dict["charging_event"]
-        .loc[uc_dict["charging_event"]["charging_use_case"].isin(["work"])]
-        .reset_index()
-    )
+    charging_events = uc_dict["event_store"].select(charging_use_case="work").reset_index()
 
     charging_events = charging_events
 
-    charging_events['office'] = np.random.choice([True, False], size=len(charging_events),
-                                                 p=[uc_dict["share_office_parking"],
-                                                    1 - uc_dict["share_office_parking"]])
+    charging_events['office'] = uc_dict["random_seed"].choice([True, False], size=len(charging_events),
+                                                          p=[uc_dict["share_office_parking"],
+                                                             1 - uc_dict["share_office_parking"]])
 
     # filter houses by region
     # in_region_bool = home_data["geometry"].within(uc_dict["boundaries"].iloc[0,0])
@@ -479,7 +397,7 @@ def work(work_data, uc_dict, office_data=None, timestep=15):
             availability_mask_office
         ) = uc_helpers.distribute_charging_events(
             in_region_office, charging_events_office, weight_column="area", simulation_steps=2000,
-            rng=uc_dict["random_seed"], return_mask=True, location_id_start= len(in_region_not_office)
+            rng=uc_dict["random_seed"], backend=uc_dict["distribution_backend"], assignment_mode=uc_dict["assignment_mode"], return_mask=True, location_id_start= len(in_region_not_office)
         )
         charging_locations_work_office["office"] = True
         located_charging_events_office["office"] = True
@@ -489,22 +407,21 @@ def work(work_data, uc_dict, office_data=None, timestep=15):
             availability_mask_not_office
         ) = uc_helpers.distribute_charging_events(
             in_region_not_office, charging_events_not_office, weight_column="area", simulation_steps=2000,
-            rng=uc_dict["random_seed"], return_mask=True
+            rng=uc_dict["random_seed"], backend=uc_dict["distribution_backend"], assignment_mode=uc_dict["assignment_mode"], return_mask=True
         )
         charging_locations_work_not_office["office"] = False
         located_charging_events_not_office["office"] = False
 
         # Depot Ladeevents in den Nachtstunden (Mo-Sa zwischen 21:00 und 8:00 Uhr)
-        charging_events_street = uc_dict["charging_event"].loc[
-            uc_dict["charging_event"]["charging_use_case"].isin(["street"]) & uc_dict["charging_event"]["Type"].isin(uc_dict["multi_use_group"])
-        ]
+        charging_events_street = uc_dict["event_store"].select(charging_use_case="street",
+                                                                Type=uc_dict["multi_use_group"])
         charging_events_public = charging_events_street.reset_index()
         charging_events_public["office"] = True
 
         # Verteilung der Street-Ladeevents auf Retail-Standorte (Multi-Use)
         charging_locations_work_after_multi_use, located_public_events = uc_helpers.distribute_charging_events(
             charging_locations_work_office, charging_events_public, weight_column="area", simulation_steps=2000,
-            rng=uc_dict["random_seed"], fill_existing_only=True, availability_mask=availability_mask_office,
+            rng=uc_dict["random_seed"], backend=uc_dict["distribution_backend"], fill_existing_only=True, availability_mask=availability_mask_office,
             flexibility_multi_use=uc_dict["flexibility_multi_use"], location_id_start= len(in_region_not_office)
         ) # charging_events_depot austauschen gegen depot_night_events
 
@@ -536,7 +453,7 @@ def work(work_data, uc_dict, office_data=None, timestep=15):
             availability_mask
         ) = uc_helpers.distribute_charging_events(
             in_region, charging_events, weight_column="area", simulation_steps=2000,
-            rng=uc_dict["random_seed"], return_mask=True
+            rng=uc_dict["random_seed"], backend=uc_dict["distribution_backend"], assignment_mode=uc_dict["assignment_mode"], return_mask=True
         )
 
 
@@ -570,6 +487,8 @@ def work(work_data, uc_dict, office_data=None, timestep=15):
         located_charging_events_gdf = located_charging_events_gdf[uc_dict["columns_output_chargingevents"]]
         charging_locations = charging_locations_work[uc_dict["columns_output_locations"]]
 
+    if uc_dict["right_size_charging_points"]:
+        charging_locations = uc_helpers.right_size_charging_points(charging_locations, located_charging_events_gdf)
     charging_locations = charging_locations[charging_locations["charging_points"] != 0]
 
     utility.save(charging_locations, uc_id, "charging-locations", uc_dict)
@@ -613,14 +532,9 @@ def retail(retail_data: gpd.GeoDataFrame, uc_dict):
     uc_id = "retail"
     print("Use case: " + uc_id)
 
-    charging_events_retail_slow = uc_dict["charging_event"].loc[
-        uc_dict["charging_event"]["charging_use_case"].isin(["retail"])
-    ]
+    charging_events_retail_slow = uc_dict["event_store"].select(charging_use_case="retail")
 
-    charging_events_retail_hpc = uc_dict["charging_event"].loc[
-        uc_dict["charging_event"]["charging_use_case"].isin(["urban_fast"])
-        & uc_dict["charging_event"]["location"].isin(["shopping"])
-    ]
+    charging_events_retail_hpc = uc_dict["event_store"].select(charging_use_case="urban_fast", location="shopping")
 
     charging_events = pd.concat(
         [charging_events_retail_slow, charging_events_retail_hpc],
@@ -663,22 +577,21 @@ def retail(retail_data: gpd.GeoDataFrame, uc_dict):
         availability_mask,
     ) = uc_helpers.distribute_charging_events(
         in_region, charging_events, weight_column="area", simulation_steps=2000,
-        rng=uc_dict["random_seed"], return_mask=True
+        rng=uc_dict["random_seed"], backend=uc_dict["distribution_backend"], assignment_mode=uc_dict["assignment_mode"], return_mask=True
     )
 
     if uc_dict["multi_use_concept"] and uc_dict["use_case_multi_use"] == "retail":
         print("multi-use-concept activated")
 
         # Depot Ladeevents in den Nachtstunden (Mo-Sa zwischen 21:00 und 8:00 Uhr)
-        charging_events_street = uc_dict["charging_event"].loc[
-            uc_dict["charging_event"]["charging_use_case"].isin(["street"]) & uc_dict["charging_event"]["Type"].isin(uc_dict["multi_use_group"])
-        ]
+        charging_events_street = uc_dict["event_store"].select(charging_use_case="street",
+                                                                Type=uc_dict["multi_use_group"])
         charging_events_public = charging_events_street.reset_index()
 
         # Verteilung der Street-Ladeevents auf Retail-Standorte
         charging_locations_retail_after_multi_use, located_public_events = uc_helpers.distribute_charging_events(
             charging_locations_retail, charging_events_public, weight_column="area", simulation_steps=2000,
-            rng=uc_dict["random_seed"], fill_existing_only=True, availability_mask=availability_mask,
+            rng=uc_dict["random_seed"], backend=uc_dict["distribution_backend"], fill_existing_only=True, availability_mask=availability_mask,
             flexibility_multi_use=uc_dict["flexibility_multi_use"]
         ) # charging_events_depot austauschen gegen depot_night_events
 
@@ -719,6 +632,8 @@ def retail(retail_data: gpd.GeoDataFrame, uc_dict):
 
     # todo checken o alle ids stimmen (bei multi-use-szenario)
 
+    if uc_dict["right_size_charging_points"]:
+        charging_locations = uc_helpers.right_size_charging_points(charging_locations, located_charging_events_gdf)
     charging_locations = charging_locations[charging_locations["charging_points"] != 0]
 
     utility.save(charging_locations, uc_id, "charging-locations", uc_dict)
@@ -740,9 +655,7 @@ def retail(retail_data: gpd.GeoDataFrame, uc_dict):
 def depot(depot_data: gpd.GeoDataFrame, uc_dict):
     uc_id = "depot"
     print("Use case: " + uc_id)
-    charging_events_depot = uc_dict["charging_event"].loc[
-        uc_dict["charging_event"]["charging_use_case"].isin(["depot"])
-    ]
+    charging_events_depot = uc_dict["event_store"].select(charging_use_case="depot")
 
     charging_events = charging_events_depot.reset_index()
 
@@ -757,7 +670,7 @@ def depot(depot_data: gpd.GeoDataFrame, uc_dict):
         located_charging_events,
     ) = uc_helpers.distribute_charging_events(
         in_region, charging_events, weight_column="area", simulation_steps=2000,
-        rng=uc_dict["random_seed"]
+        rng=uc_dict["random_seed"], backend=uc_dict["distribution_backend"], assignment_mode=uc_dict["assignment_mode"]
     )
 
     # Merge Chargin_events and Locations
@@ -780,6 +693,8 @@ def depot(depot_data: gpd.GeoDataFrame, uc_dict):
     charging_locations = charging_locations_depot[uc_dict["columns_output_locations"]]
     located_charging_events_gdf = located_charging_events_gdf[uc_dict["columns_output_chargingevents"]]
 
+    if uc_dict["right_size_charging_points"]:
+        charging_locations = uc_helpers.right_size_charging_points(charging_locations, located_charging_events_gdf)
     charging_locations = charging_locations[charging_locations["charging_points"] != 0]
 
     utility.save(charging_locations, uc_id, "charging-locations", uc_dict)
@@ -3,196 +3,262 @@ import utility as utility
 import pandas as pd
 import geopandas as gpd
 import numpy as np
-import math
 
-def postprocess_public_demands(charging_locations: gpd.GeoDataFrame, located_charging_events: gpd.GeoDataFrame):
+import capacity_engine
 
+def postprocess_public_demands(charging_locations: gpd.GeoDataFrame, located_charging_events: gpd.GeoDataFrame):
+    """
+    Move home_street events to the first street location within max_distance that has a free charging point
+    for the whole event, then set the charging points of every location to its peak occupancy.
+    located_charging_events is changed in place.
+    """
     print("--- postprocessing of public demands started... ---")
 
     max_distance = 1000 # Meter
 
-    # Filter street locations und home_street Events
-    street_locations = charging_locations[charging_locations["mode"] == "street"].copy()
-    home_events = located_charging_events[located_charging_events["mode"] == "home_street"].copy()
-    street_events = located_charging_events[located_charging_events["mode"] == "street"].copy()
+    # Standorte als Index 0..n-1, Events als Standortindex (-1: kein Standort aus charging_locations)
+    location_ids = pd.Index(charging_locations["location_id"])
+    event_locations = location_ids.get_indexer(located_charging_events["location_id"])
+    starts = located_charging_events["event_start"].to_numpy(dtype=np.int64)
+    ends = starts + located_charging_events["event_time"].to_numpy(dtype=np.int64)
+    charging_points = charging_locations["charging_points"].to_numpy()
 
-    # Maximaler Zeitschritt (für Maskenlänge)
-    max_step = max(located_charging_events["event_start"].max(), (located_charging_events["event_start"]+located_charging_events["event_time"]).max())
+    # Filter street locations und home_street Events
+    street = np.flatnonzero((charging_locations["mode"] == "street").to_numpy())
+    home_events = np.flatnonzero((located_charging_events["mode"] == "home_street").to_numpy())
+
+    # Kandidaten aller home_street Events mit einer Abfrage, je Event in der Reihenfolge des Baums
+    event_idx, candidates = charging_locations.iloc[street].sindex.query(
+        located_charging_events.geometry.values[home_events], predicate="dwithin", distance=max_distance)
+    order = np.argsort(event_idx, kind="stable")
+    event_idx, candidates = event_idx[order], street[candidates[order]]
+    bounds = np.searchsorted(event_idx, np.arange(len(home_events) + 1))
+
+    # Belegung der street locations (Zeitschritte x Standorte) mit den bestehenden Events
+    at_street = np.zeros(len(location_ids) + 1, dtype=bool)
+    at_street[street] = True
+    at_street = at_street[event_locations]  # Index -1 trifft den letzten Eintrag (False)
+    horizon = int(max(starts.max(), ends.max())) + 1 if len(starts) else 1
+    store = capacity_engine.AvailabilityStore.from_intervals(len(location_ids), horizon, event_locations[at_street],
+                                                             starts[at_street], ends[at_street])
+    # alle street locations bekommen eine Spalte; verschoben wird nur bis zur Zahl ihrer Ladepunkte
+    for loc in street:
+        store.activate(loc)
+    store.reserve(int(charging_points[street].max()) if len(street) else 0)
+
+    new_locations = np.full(len(home_events), -1, dtype=np.int64)
+    for i in np.flatnonzero(bounds[1:] > bounds[:-1]):
+        event = home_events[i]
+        start, end = starts[event], ends[event]
+        candidate_locs = candidates[bounds[i]:bounds[i + 1]]
+
+        # Prüfe freie Kapazität: erster Kandidat, dessen Belegung im ganzen Zeitfenster unter den Ladepunkten liegt
+        if end > start:
+            free = store.window(start, end)[:, store.column[candidate_locs]].max(axis=0) < charging_points[candidate_locs]
+            first = free.argmax()
+            if not free[first]:
+                continue
+            new_location = candidate_locs[first]
+        else:
+            new_location = candidate_locs[0]
+
+        old_location = event_locations[event]
+        if old_location >= 0 and store.column[old_location] >= 0:
+            store.data[start:end, store.column[old_location]] -= 1
+        store.data[start:end, store.column[new_location]] += 1
+        new_locations[i] = new_location
+
+    # Ladevents umverteilen
+    moved = new_locations >= 0
+    rows = home_events[moved]
+    event_locations[rows] = new_locations[moved]
+    location_column = located_charging_events.columns.get_loc("location_id")
+    located_charging_events.iloc[rows, location_column] = location_ids.values[new_locations[moved]].astype(
+        located_charging_events["location_id"].dtype)
+    located_charging_events.iloc[rows, located_charging_events.columns.get_loc("mode")] = "street"
+    umverteilte_events = len(rows)
+
+    # maximale gleichzeitige Belegung je Location, Ladepunkte werden auf diese erhöht oder reduziert
+    known = event_locations >= 0
+    max_concurrent_demand = capacity_engine.peak_concurrency(event_locations[known], starts[known], ends[known],
+                                                             len(location_ids))
+    zugeschlagene_punkte = int(np.maximum(max_concurrent_demand - charging_points, 0).sum())
+    charging_locations["charging_points"] = max_concurrent_demand.astype(charging_locations["charging_points"].dtype)
 
-    # Belegungs-Maske: location_id -> np.array (Zeitschritte)
-    occupancy_mask = {}
-    for loc_id in charging_locations["location_id"]:
-        occupancy_mask[loc_id] = np.zeros(max_step + 1, dtype=int)
+    print(f"Anzahl umverteilter Ladeevents von 'home_street' auf 'street': {umverteilte_events}")
+    print(f"Anzahl neu hinzugefügter Ladepunkte an street-Standorten: {zugeschlagene_punkte}")
+    print(f"Maximale gleichzeitige Belegung für jede Location berechnet.")
 
-    # Maske mit bestehenden street Events füllen
-    for _, event in located_charging_events.iterrows():
-        loc_id = event["location_id"]
-        mode = event["mode"]
-        start = event["event_start"]
-        end = event["event_start"]+event["event_time"]
-        if loc_id in occupancy_mask:
-            occupancy_mask[loc_id][start:end] += 1
+    return charging_locations, located_charging_events
 
-    # Räumlicher Index für street locations
-    street_locations_sindex = street_locations.sindex
+def right_size_charging_points(charging_locations: pd.DataFrame, located_charging_events: pd.DataFrame):
+    """
+    Trim the charging points of every location to the peak number of simultaneous events located there.
+    Events shorter than one time step count as one time step, so every location with events keeps a point.
 
-    umverteilte_events = 0
-    zugeschlagene_punkte = 0
+    :return: copy of charging_locations with the trimmed charging points
+    """
+    location_ids = pd.Index(charging_locations["location_id"])
+    event_locations = location_ids.get_indexer(located_charging_events["location_id"])
+    known = event_locations >= 0
+    starts = located_charging_events["event_start"].to_numpy(dtype=np.int64)[known]
+    durations = np.maximum(located_charging_events["event_time"].to_numpy(dtype=np.int64)[known], 1)
+    peaks = capacity_engine.peak_concurrency(event_locations[known], starts, starts + durations, len(location_ids))
+
+    charging_points = charging_locations["charging_points"].to_numpy()
+    trimmed = np.minimum(charging_points, peaks)
+    print(f"right-sizing: {int(charging_points.sum() - trimmed.sum())} charging points above the peak removed")
+
+    charging_locations = charging_locations.copy()
+    charging_locations["charging_points"] = trimmed.astype(charging_locations["charging_points"].dtype)
+    return charging_locations
+
+def split_home_events(charging_events, data_dict):
+    """
+    Split the home charging events into home_apartment and home_detached with the shares of the config,
+    drawn from data_dict["random_seed"]. Events that are already split are drawn again, so the split can be
+    redone for another seed without parsing the events again.
+    """
+    if isinstance(charging_events["charging_use_case"].dtype, pd.CategoricalDtype):
+        neue_kategorien = {"home_apartment", "home_detached"} - set(charging_events["charging_use_case"].cat.categories)
+        charging_events["charging_use_case"] = charging_events["charging_use_case"].cat.add_categories(
+            sorted(neue_kategorien))
 
-    for idx, event in located_charging_events.iterrows():
+    # Maske: nur dort, wo der zielwert vorkommt
+    maske = charging_events["charging_use_case"].isin(["home", "home_apartment", "home_detached"])
+    anzahl = maske.sum()
 
-        if event["mode"] == "home_street":
-            event_point = event.geometry
-            start = event["event_start"]
-            end = event["event_start"]+event["event_time"]
-            old_location_id = event["location_id"]
+    # Neue Werte zufällig generieren
+    neue_werte = data_dict["random_seed"].choice(["home_apartment", "home_detached"],
+                                                 size=anzahl, p=[data_dict["share_home_apartment"],
+                                                                 data_dict["share_home_detached"]])
 
-            # Kandidaten in 500m suchen
-            candidate_idx = list(street_locations_sindex.intersection(event_point.buffer(max_distance).bounds))
-            candidate_locs = street_locations.iloc[candidate_idx]
-            candidate_locs = candidate_locs[candidate_locs.geometry.distance(event_point) <= max_distance]
+    # Einsetzen der neuen Werte
+    charging_events.loc[maske, "charging_use_case"] = neue_werte
+    return charging_events
 
-            if candidate_locs.empty:
-                continue  # Kein Standort in Reichweite
 
-            # Prüfe freie Kapazität in Maske
-            loc_with_free_capacity = None
-            for _, loc in candidate_locs.iterrows():
-                loc_id = loc["location_id"]
-                charging_points = loc["charging_points"]
-                occupancy = occupancy_mask[loc_id][start:end]
+def begrenzte_parkdauer(start, dauer, lade, limit_schritte, start_grenze, end_grenze, tag_laenge=96):
+    """
+    Parkdauer der Events nach der Begrenzung im Zeitfenster [start_grenze, end_grenze) jedes Tages.
 
-                if np.all(occupancy < charging_points):
-                    loc_with_free_capacity = loc
-                    break
+    Jeder Durchlauf bearbeitet für alle noch offenen Events den nächsten Tagesabschnitt, die Zahl der
+    Durchläufe ist durch die Zahl der Tage des längsten Events begrenzt.
 
-            if loc_with_free_capacity is not None:
-                new_location_id = loc_with_free_capacity["location_id"]
+    :param start: Startzeitschritte der Events
+    :param dauer: Parkdauer in Zeitschritten
+    :param lade: benötigte Ladezeit in Zeitschritten
+    :return: begrenzte Parkdauer (int64)
+    """
+    start = np.asarray(start, dtype=np.int64)
+    dauer = np.asarray(dauer, dtype=np.int64)
+    ende = start + dauer
+    # längere Ladezeiten als das Limit werden nicht abgeschnitten
+    max_ladezeit = np.where(lade > limit_schritte, lade, limit_schritte)
 
-                # Ladevent umverteilen
-                located_charging_events.at[idx, "location_id"] = new_location_id
-                located_charging_events.at[idx, "mode"] = "street"
+    neuer_start = start.copy()
+    neue_dauer = np.zeros(len(start))
+    offen = np.flatnonzero(neuer_start < ende)
+    while offen.size:
+        ns = neuer_start[offen]
+        tag_start = (ns // tag_laenge) * tag_laenge
+        fenster_start = tag_start + start_grenze
+        fenster_ende = tag_start + end_grenze
 
-                # Maske updaten
-                # Abziehen der belegten Zeitschritte von der ursprünglichen home_street Location
-                occupancy_mask[old_location_id][start:end] -= 1
+        teil_ende = np.minimum(ende[offen], tag_start + tag_laenge)
+        teil_dauer = teil_ende - ns
 
-                # Hinzufügen der belegten Zeitschritte zu der neuen location_id
-                occupancy_mask[new_location_id][start:end] += 1
+        # Abschnitt außerhalb des Fensters oder Beginn im letzten 4h-Fenster: ganzer Abschnitt zählt
+        frei = (ns >= fenster_ende) | (teil_ende <= fenster_start) | (ns >= fenster_ende - limit_schritte)
 
-                umverteilte_events += 1
+        overlap = np.maximum(0, np.minimum(teil_ende, fenster_ende) - np.maximum(ns, fenster_start))
+        vor_fenster = np.maximum(0, fenster_start - ns)
+        neue_dauer[offen] += np.where(frei, teil_dauer, vor_fenster + np.minimum(overlap, max_ladezeit[offen]))
 
-    print(f"Anzahl umverteilter Ladeevents von 'home_street' auf 'street': {umverteilte_events}")
-    print(f"Anzahl neu hinzugefügter Ladepunkte an street-Standorten: {zugeschlagene_punkte}")
+        neuer_start[offen] = np.where(frei, teil_ende, fenster_ende)
+        offen = offen[neuer_start[offen] < ende[offen]]
 
-    # Berechnung der maximalen gleichzeitigen Belegung je Location
-    max_concurrent_demand = {}
-    for loc_id in occupancy_mask:
-        # Maximale Belegung für die Location berechnen (maximale Anzahl von Ladeevents zu einem Zeitpunkt)
-        max_concurrent_demand[loc_id] = occupancy_mask[loc_id].max()
-
-        # Vergleiche maximale Belegung mit Ladepunkten der Location
-        current_charging_points = charging_locations.loc[charging_locations["location_id"] == loc_id, "charging_points"].values[0]
-        if max_concurrent_demand[loc_id] > current_charging_points:
-            # Wenn mehr Ladeevents gleichzeitig laufen, als Ladepunkte vorhanden sind, erhöhen wir die Ladepunkte
-            required_points = max_concurrent_demand[loc_id] - current_charging_points
-            charging_locations.loc[charging_locations["location_id"] == loc_id, "charging_points"] += required_points
-
-
-            # Auch in der Belegungsmaske für diese Location die Ladepunkte erhöhen
-            zugeschlagene_punkte += required_points
-        elif max_concurrent_demand[loc_id] < current_charging_points:
-            # Wenn weniger Ladeevents gleichzeitig belegt sind als Ladepunkte verfügbar, reduzieren wir die Ladepunkte
-            charging_locations.loc[charging_locations["location_id"] == loc_id, "charging_points"] = max_concurrent_demand[
-                loc_id]
-    print(f"Maximale gleichzeitige Belegung für jede Location berechnet.")
+    return np.minimum(neue_dauer, dauer).astype(np.int64)
 
-    return charging_locations, located_charging_events
 
 def park_time_limitation(charging_events, data_dict, charging_use_case):
     print("limit parking time")
 
-    df = charging_events # .loc[charging_events["charging_use_case"] == charging_use_case].copy()
-
-    # if start >= start_grenze and start < end_grenze:
-    #     if (row['energy'] / row['station_charging_capacity'] * 4) > limit_schritte:
-    #         return row['energy'] / row['station_charging_capacity'] * 4
-    #     return min(row['event_time'], limit_schritte)
+    df = charging_events
 
     limit_schritte = data_dict["charging_time_limit_duration"] # 4h
-    tag_laenge = 96 # 24h
     start_grenze = data_dict["charging_time_limit_start"] # 9:00
     end_grenze = data_dict["charging_time_limit_end"] # 21:00
 
-    def begrenze_event(row):
-        start = row['event_start']
-        dauer = row['event_time']
-        lade = row['energy'] / row['station_charging_capacity'] * 4
-        ende = start + dauer
-
-        neuer_start = start
-        neue_dauer = 0
-
-        while neuer_start < ende:
-            tag_start = (neuer_start // tag_laenge) * tag_laenge
-            fenster_start = tag_start + start_grenze
-            fenster_ende = tag_start + end_grenze
-
-            teil_ende = min(ende, tag_start + tag_laenge)
-            teil_dauer = teil_ende - neuer_start
+    original_event_time = df['event_time'].to_numpy(copy=True)
+    maske = (charging_events["charging_use_case"] == charging_use_case).values
+    if maske.any():
+        events = df.loc[maske]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            lade = events['energy'].values / events['station_charging_capacity'].values * 4
+        neue_dauer = begrenzte_parkdauer(events['event_start'].values, events['event_time'].values, lade,
+                                         limit_schritte, start_grenze, end_grenze)
+        df.loc[maske, 'event_time'] = neue_dauer.astype(df['event_time'].dtype)
+    df['wurde_begrenzt'] = df['event_time'].values < original_event_time
+
+    return df
+
+USE_CASE_IDS = {
+    "home_detached": 1,
+    "home_apartment": 2,
+    "work": 3,
+    "hpc": 4,
+    "retail": 5,
+    "public": 6,
+    "depot": 7
+}
+# Stellen des Standortindex in der ID, fest für alle Use-Cases und Läufe: ID = Präfix * 10**k + Index
+LOCATION_ID_DIGITS = 9
 
-            if neuer_start >= fenster_ende or teil_ende <= fenster_start:
-                neue_dauer += teil_dauer
-                neuer_start += teil_dauer
-                continue
-
-            overlap_start = max(neuer_start, fenster_start)
-            overlap_end = min(teil_ende, fenster_ende)
-            overlap = max(0, overlap_end - overlap_start)
-
-            # Ausnahme: Beginn im letzten 4h-Fenster
-            if neuer_start >= fenster_ende - limit_schritte:
-                neue_dauer += teil_dauer
-                neuer_start += teil_dauer
-                continue
 
-            max_ladezeit = lade if lade > limit_schritte else limit_schritte
-            begrenzt_overlap = min(overlap, max_ladezeit)
-
-            vor_fenster = max(0, fenster_start - neuer_start)
-            neue_dauer += vor_fenster + begrenzt_overlap
+def get_id(use_case_id, location_id):
+    """
+    IDs of the locations of a use case: use case prefix * 10**LOCATION_ID_DIGITS + location index.
 
-            neuer_start = fenster_ende
+    :param location_id: location indices (Series or array of non-negative integers)
+    :return: int64 array
+    """
+    index = np.asarray(location_id).astype(np.int64)
+    if index.size and (index.min() < 0 or index.max() >= 10 ** LOCATION_ID_DIGITS):
+        raise ValueError(f"Location indices of {use_case_id} have to be in [0, 10**{LOCATION_ID_DIGITS}).")
 
-        return int(min(neue_dauer, dauer))
+    return np.int64(USE_CASE_IDS[use_case_id]) * 10 ** LOCATION_ID_DIGITS + index
 
-    # Neue Spalte: Originale Dauer speichern
-    df['original_event_time'] = df['event_time']
-    df['event_time'].loc[charging_events["charging_use_case"] == charging_use_case] = df.loc[charging_events["charging_use_case"] == charging_use_case].apply(begrenze_event, axis=1)
-    df['wurde_begrenzt'] = df['event_time'] < df['original_event_time']
 
-    return df.drop(columns=['original_event_time'])
+def decode_id(ids):
+    """
+    Split IDs built by get_id into use case and location index.
 
-def get_id(use_case_id, location_id):
+    :return: array of use case names and int64 array of location indices
+    """
+    prefix, index = np.divmod(np.asarray(ids).astype(np.int64), 10 ** LOCATION_ID_DIGITS)
+    names = np.full(max(USE_CASE_IDS.values()) + 1, None, dtype=object)
+    names[list(USE_CASE_IDS.values())] = list(USE_CASE_IDS)
+    if prefix.size and (prefix.min() < 0 or prefix.max() >= len(names) or not all(names[np.unique(prefix)])):
+        raise ValueError("Unknown use case prefix in location IDs.")
+    return names[prefix], index
 
-    # todo: eliminate float in ids
 
-    use_case_map = {
-        "home_detached": "1",
-        "home_apartment": "2",
-        "work": "3",
-        "hpc": "4",
-        "retail": "5",
-        "public": "6",
-        "depot": "7"
-    }
+RNG_STREAMS = ("input", "home_detached", "home_apartment", "work", "hpc", "retail", "public", "depot")
 
-    location_id = location_id.astype(int)
-    uc_id = use_case_map.get(use_case_id)
 
-    ids = location_id.astype(str).apply(lambda x: int(uc_id + x))
+def rng_stream(seed_sequence: np.random.SeedSequence, name: str) -> np.random.Generator:
+    """
+    Random generator for the stream 'name' (input parsing or a use case). It is the child of
+    'seed_sequence' that SeedSequence.spawn(len(RNG_STREAMS)) returns at the position of 'name', but it is
+    built without changing 'seed_sequence', so the streams do not depend on the order or the process in
+    which they are requested.
+    """
+    child = np.random.SeedSequence(seed_sequence.entropy,
+                                   spawn_key=seed_sequence.spawn_key + (RNG_STREAMS.index(name),),
+                                   pool_size=seed_sequence.pool_size)
+    return np.random.default_rng(child)
 
-    return ids.values.astype(int)
 
 def distribute_charging_events(
     locations: gpd.GeoDataFrame,
@@ -203,26 +269,42 @@ def distribute_charging_events(
     rng: np.random.Generator = None,
     #home_street: bool = False,
     fill_existing_only: bool = False,  # New behavior
-    availability_mask: np.array = None,
+    availability_mask: capacity_engine.AvailabilityStore = None,
     flexibility_multi_use: int = 0,
     return_mask: bool = False,
     seed: int = 1,
     additional_street_input: bool = False,
-    location_id_start: int = 0
+    location_id_start: int = 0,
+    backend: str = "numpy",
+    assignment_mode: str = "sequential"
 ):
     """
     Distributes charging events to locations with optional random assignment.
     Tracks number of charging points and average charging capacity per location.
     If 'fill_existing_only' is True, only existing charging points are filled.
+    With 'return_mask' the occupancy is returned as capacity_engine.AvailabilityStore, which can be passed
+    as 'availability_mask' to a following 'fill_existing_only' run on the same locations.
+    Every call draws from its own child stream of 'rng' (Generator.spawn), so the result only depends on
+    the stream of the use case and the position of the call within the use case. Without 'rng' the
+    streams are derived from 'seed'.
+    'backend' selects the assignment kernel ("numpy" or the JIT-compiled "numba"), both give identical results.
+    'assignment_mode' "sequential" handles the events in their given order. "bucketed" handles them in
+    chronological order, all events of one start time step at once, and keeps the given order within a time
+    step (same result as "sequential" on events sorted by start). "bucketed_relaxed" does not keep the order
+    within a time step.
     """
-    # reset seed so that the locations are always the same
-    rng = np.random.default_rng(seed)
+    if assignment_mode not in capacity_engine.ASSIGNMENT_MODES:
+        raise ValueError(f"Unknown assignment mode '{assignment_mode}', choose one of "
+                         f"{capacity_engine.ASSIGNMENT_MODES}.")
+    # eigener Zufallsstrom je Verteilungsaufruf, abgeleitet vom Strom des Use-Cases
+    rng = (rng if rng is not None else np.random.default_rng(seed)).spawn(1)[0]
 
     if fill_existing_only:
         print("Using the 'fill_existing_only' method: Only existing charging points will be filled.")
         return distribute_charging_events_fill_existing_only(
-            locations, events, weight_column, simulation_steps, flexibility_multi_use, rng, availability_mask,
-            additional_street_input= additional_street_input, location_id_start=location_id_start
+            locations, events, simulation_steps, flexibility_multi_use, rng, availability_mask,
+            additional_street_input= additional_street_input, location_id_start=location_id_start,
+            backend=backend
         )
 
     # if home_street:
@@ -233,72 +315,45 @@ def distribute_charging_events(
     n_locations = len(locations)
     n_events = len(events)
 
-    # Normalize weights
-    probabilities = locations[weight_column].values / locations[weight_column].sum()
+    # Normalize weights once, draws are looked up in the cached cumulative distribution
+    sampler = capacity_engine.WeightedSampler(locations[weight_column].values, rng)
 
     # Initial setup
 
     locations = locations.reset_index().copy()
 
-    locations["charging_points"] = 0
-    locations["average_charging_capacity"] = 0.0  # in kW
-    assigned_locations = np.full(n_events, np.nan)
+    # plain arrays for the event loop, the DataFrames are only touched again after the distribution
+    starts = events["event_start"].values.astype(np.int64)
+    ends = starts + events["event_time"].values.astype(np.int64)
+    capacities = events["station_charging_capacity"].values.astype(float)  # in kW
 
-    # Create availability matrix: rows=locations, cols=timesteps
-    # todo: exchange locations with availability_mask, hier gibt es ein Problem mit dem index aus der availability und dem index des DataFrames, Abgl
+    # Availability store: time steps x locations with charging points, horizon from the latest event end
     # if home_street:
     #     availability_home_street = np.zeros((n_locations_home_street, simulation_steps), dtype=int)
     #     availability_not_home_street = np.zeros((n_locations_not_home_street, simulation_steps), dtype=int)
     # else:
-    availability = np.zeros((n_locations, simulation_steps), dtype=int)
-
-    print("Distributing charging events...")
-
-    for idx in range(n_events):
-        start = events.at[idx, "event_start"]
-        duration = events.at[idx, "event_time"]
-        end = start + duration
-        capacity = events.at[idx, "station_charging_capacity"]  # in kW
-        # if events.at[idx, "charging_use_case"] == "public" and events.at[idx, "location"] == "home":
-
-        if fill_existing_first:
-
-            if additional_street_input:
-                availability_mask = np.zeros((len(locations), 2000))
-            if availability.size < 1:
-                print()
-            if start >= end:
-                print("Fehler bei übergebener Maske zur Übertragung von Ladeevents")
-            in_use = availability[:, start:end].max(axis=1)
-            required = locations["charging_points"].values
-            free_mask = in_use < required
-
-            if free_mask.any():
-                assigned = np.argmax(free_mask)
-            else:
-                assigned = rng.choice(n_locations, p=probabilities)
-                # Increase number of charging points
-                loc_idx = locations.index[assigned]
-                prev_count = locations.at[loc_idx, "charging_points"]
-                prev_avg = locations.at[loc_idx, "average_charging_capacity"]
-                new_avg = (prev_avg * prev_count + capacity) / (prev_count + 1)
-                locations.at[loc_idx, "charging_points"] += 1
-                locations.at[loc_idx, "average_charging_capacity"] = new_avg
-        else:
-            assigned = rng.choice(n_locations, p=probabilities)
-            loc_idx = locations.index[assigned]
-            prev_count = locations.at[loc_idx, "charging_points"]
-            prev_avg = locations.at[loc_idx, "average_charging_capacity"]
-            new_avg = (prev_avg * prev_count + capacity) / (prev_count + 1)
-            locations.at[loc_idx, "charging_points"] += 1
-            locations.at[loc_idx, "average_charging_capacity"] = new_avg
+    horizon = int(ends.max()) if n_events else 0
 
-        availability[assigned, start:end] += 1
-        assigned_locations[idx] = locations.index[assigned]
+    if fill_existing_first and assignment_mode != "sequential":
+        print("Distributing charging events (bucketed by start time step)...")
+        assigned, charging_points, average_capacity, availability = capacity_engine.place_bucketed(
+            sampler, starts, ends, capacities, horizon, stable=assignment_mode == "bucketed"
+        )
+    elif fill_existing_first:
+        print("Distributing charging events...")
+        assigned, charging_points, average_capacity, availability = capacity_engine.place_fill_existing_first(
+            sampler, starts, ends, capacities, horizon, backend=backend
+        )
+    else:
+        # every event gets a new charging point, no availability check -> draw all locations at once
+        print("Distributing charging events (vectorized, without availability check)...")
+        assigned, charging_points, average_capacity, availability = capacity_engine.place_randomly(
+            sampler, starts, ends, capacities, return_store=return_mask
+        )
 
-        if n_events > 10000 and idx % (n_events // 10000 + 1) == 0:
-            percent = (idx + 1) / n_events * 100
-            print(f"\rProgress: {percent:.2f}%", end='', flush=True)
+    locations["charging_points"] = charging_points
+    locations["average_charging_capacity"] = average_capacity  # in kW
+    assigned_locations = locations.index.values[assigned].astype(float)
 
     print("\nDone.")
 
@@ -317,81 +372,57 @@ def distribute_charging_events(
 def distribute_charging_events_fill_existing_only(
     locations: gpd.GeoDataFrame,
     events: pd.DataFrame,
-    weight_column: str,
     simulation_steps: int,
     max_shift_steps: int = 0,
     rng: np.random.Generator = None,
-    availability_mask: np.array = None,
+    availability_mask: capacity_engine.AvailabilityStore = None,
     additional_street_input: bool = False,
-    location_id_start: int = 0
+    location_id_start: int = 0,
+    backend: str = "numpy"
 ):
     """
     Distributes charging events to existing locations with available charging points.
     Does not add new charging points. If all charging points are filled, no further charging events are assigned.
     Allows rescheduling events by up to `max_shift_steps` time steps if no immediate availability is found.
     """
-    if additional_street_input:
-        availability_mask = np.zeros((len(locations), 2000))
-
     n_locations = len(locations)
     n_events = len(events)
 
-    # Normalize weights
-    probabilities = locations[weight_column].values / locations[weight_column].sum()
-
     # Initial setup
     locations = locations.reset_index().copy()
     # locations = locations.copy()
     locations["charging_points"] = locations["charging_points"].astype(int)  # Ensure the column is integer
-    assigned_locations = np.full(n_events, np.nan)
 
-    # Availability matrix: rows=locations, cols=timesteps
-    availability = availability_mask.copy()
+    # Availability store: time steps x locations with charging points
+    if additional_street_input or availability_mask is None:
+        availability = capacity_engine.AvailabilityStore(n_locations, simulation_steps)
+    elif isinstance(availability_mask, capacity_engine.AvailabilityStore):
+        availability = availability_mask.copy()
+    else:
+        availability = capacity_engine.AvailabilityStore.from_dense(availability_mask)
 
     print("Distributing charging events (only to existing charging points)...")
-    counter_redistributed_events = 0
-    for idx in range(n_events):
-        original_start = events.at[idx, "event_start"]
-        base_duration = events.at[idx, "event_time"]
-        energy = events.at[idx, "energy"]
-        capacity = events.at[idx, "station_charging_capacity"]  # in kW
-
-        assigned = None
-        for shift in range(0, max_shift_steps + 1):
-            start = original_start + shift
-
-            # Berechne neue Dauer je nach verbleibender Zeit
-            if base_duration - shift < energy / capacity * 4:
-                duration = min(math.ceil(energy / capacity * 4), base_duration)
-            else:
-                duration = base_duration - shift
-
-            end = start + duration
-
-            if end > simulation_steps:
-                continue  # Don't assign if end exceeds simulation time
-
-            free_mask = availability[:, start:end].sum(axis=1) < locations["charging_points"].values
-            if free_mask.any():
-                assigned = np.argmax(free_mask)
-                counter_redistributed_events += 1
-                events.at[idx, "event_start"] = start
-                events.at[idx, "event_time"] = duration
-                break  # Exit the shift loop once assigned
-
-        if assigned is not None:
-            availability[assigned, start:end] += 1
-            assigned_locations[idx] = locations.index[assigned]
-        # else: Event bleibt unzugewiesen
-
+    assigned, new_starts, new_durations = capacity_engine.place_fill_existing_only(
+        availability, locations["charging_points"].values,
+        events["event_start"].values.astype(np.int64), events["event_time"].values.astype(np.int64),
+        events["energy"].values.astype(float), events["station_charging_capacity"].values.astype(float),
+        max_shift_steps, simulation_steps, backend=backend
+    )
+    # else: Event bleibt unzugewiesen
+    is_assigned = assigned >= 0
+    counter_redistributed_events = int(is_assigned.sum())
 
     print(f"Total redistributed events: {counter_redistributed_events}")
 
     print("transfered multi-use charging events:", counter_redistributed_events)
 
-    # Mark locations with assigned events
+    # Mark locations with assigned events, shifted start and duration only for assigned events
     events = events.copy()
+    events.loc[is_assigned, "event_start"] = new_starts[is_assigned].astype(events["event_start"].dtype)
+    events.loc[is_assigned, "event_time"] = new_durations[is_assigned].astype(events["event_time"].dtype)
 
+    assigned_locations = np.full(n_events, np.nan)
+    assigned_locations[is_assigned] = locations.index.values[assigned[is_assigned]]
     events["assigned_location"] = assigned_locations + location_id_start
 
     locations.index = locations.index + location_id_start
@@ -1,5 +1,6 @@
 import geopandas as gpd
 import pandas as pd
+import numpy as np
 import os
 import math
 import datetime
@@ -7,7 +8,19 @@ from datetime import timedelta
 #import matplotlib.pyplot as plt
 
 import geopandas as gpd
+import shapely
 from shapely.geometry import Point
+import pathlib
+import threading
+import collections
+
+# laufende Hintergrund-Exporte und deren Fehler
+_export_threads = []
+_export_errors = []
+# Schreiber der Ergebnistabellen im Hintergrund, je Prozess einer
+_result_writer = None
+# grobe Größe eines Geometrie-Objekts ohne Koordinaten (Python-Objekt und GEOS-Struktur)
+GEOMETRY_OVERHEAD_BYTES = 100
 
 def calculate_hpc_locations(standorte_gdf, linien_gdf, verkehrs_spalte='dtvw_kfz', max_entfernung=200):
 
@@ -30,41 +43,40 @@ def calculate_hpc_locations(standorte_gdf, linien_gdf, verkehrs_spalte='dtvw_kfz
         verkehrs_spalte = "AverageTrafficVolume"
 
     standorte_gdf = standorte_gdf.to_crs(linien_gdf.crs)
+    linien = linien_gdf[[verkehrs_spalte, linien_gdf.geometry.name]].reset_index(drop=True)
+    punkte = gpd.GeoDataFrame(geometry=standorte_gdf.geometry.values, crs=linien_gdf.crs)
 
-    max_verkehr = linien_gdf[verkehrs_spalte].max()
+    max_verkehr = linien[verkehrs_spalte].max()
 
-    rohe_gewichte = []
-    entfernungen = []
-    markierungen = []
-    verkehre = []
+    # nächste Linie je Standort im Umkreis max_entfernung (STRtree), bei gleichem Abstand die erste Linie
+    naechste = gpd.sjoin_nearest(punkte, linien, how="inner", max_distance=max_entfernung,
+                                 distance_col="distanz")
+    naechste = naechste.rename_axis("punkt").sort_values(["punkt", "index_right"])
+    naechste = naechste[~naechste.index.duplicated()]
 
-    for punkt in standorte_gdf.geometry:
-        linien_gdf['distanz'] = linien_gdf.geometry.distance(punkt)
-        naechste = linien_gdf.loc[linien_gdf['distanz'].idxmin()]
-        entfernung = naechste['distanz']
+    entfernungen = np.empty(len(punkte))
+    verkehre = np.zeros(len(punkte), dtype=linien[verkehrs_spalte].dtype)
+    markierungen = np.ones(len(punkte), dtype=bool)
+    markierungen[naechste.index] = False
+    entfernungen[naechste.index] = naechste["distanz"].values
+    verkehre[naechste.index] = naechste[verkehrs_spalte].values
 
-        if entfernung > max_entfernung:
-            rohe_gewichte.append(0)
-            verkehre.append(0)
-            entfernungen.append(entfernung)
-            markierungen.append(True)
-        else:
-            verkehr = naechste[verkehrs_spalte]
-            verkehr_norm = naechste[verkehrs_spalte] / max_verkehr
-            entfernung_faktor = 1 - (entfernung / max_entfernung)
-            gewicht = 0.8 * verkehr_norm + 0.2 * entfernung_faktor
-            rohe_gewichte.append(gewicht)
-            entfernungen.append(entfernung)
-            markierungen.append(False)
-            verkehre.append(verkehr)
+    # Standorte ohne Linie im Umkreis: Entfernung zur nächsten Linie ohne Begrenzung
+    if markierungen.any():
+        _, distanz = linien.sindex.nearest(punkte.geometry.values[markierungen], return_all=False,
+                                           return_distance=True)
+        entfernungen[markierungen] = distanz
+
+    rohe_gewichte = np.where(markierungen, 0,
+                             0.8 * (verkehre / max_verkehr) + 0.2 * (1 - entfernungen / max_entfernung))
 
     # Normalisierung auf Bereich [0, 1]
-    min_wert = min(rohe_gewichte)
-    max_wert = max(rohe_gewichte)
-    normierte_gewichte = [
-        0 if markierungen[i] else (gw - min_wert) / (max_wert - min_wert) if max_wert > min_wert else 1
-        for i, gw in enumerate(rohe_gewichte)
-    ]
+    min_wert = rohe_gewichte.min()
+    max_wert = rohe_gewichte.max()
+    if max_wert > min_wert:
+        normierte_gewichte = np.where(markierungen, 0, (rohe_gewichte - min_wert) / (max_wert - min_wert))
+    else:
+        normierte_gewichte = np.where(markierungen, 0, 1)
 
     # Ergebnisse hinzufügen
     standorte_gdf['gewicht'] = normierte_gewichte
@@ -168,16 +180,176 @@ def weights_to_dict(weights: pd.DataFrame):
 
 
 # save in .csv format
+OUTPUT_FORMATS = ("csv", "gpkg", "parquet")
+
+
+def output_path(result_dir, uc, dataset_name, output_format, partitioned=False):
+    """
+    Path of an output table. Partitioned parquet outputs of all use cases form one dataset per table:
+    output_<dataset_name>/uc=<uc>/part-0.parquet
+    """
+    if output_format == "parquet" and partitioned:
+        return pathlib.Path(result_dir, 'output_{}'.format(dataset_name), 'uc={}'.format(uc), 'part-0.parquet')
+    return pathlib.Path(result_dir, 'output_{}_{}.{}'.format(uc, dataset_name, output_format))
+
+
+def write_output(data, uc, dataset_name, uc_dict):
+    """Write `data` in all formats of uc_dict["output_formats"] (default csv and gpkg)."""
+    partitioned = uc_dict.get("output_partitioned", False)
+    for output_format in uc_dict.get("output_formats", ("csv", "gpkg")):
+        path = output_path(uc_dict["result_dir"], uc, dataset_name, output_format, partitioned)
+        if output_format == "csv":
+            data.to_csv(path, sep=',', decimal='.')
+        elif output_format == "gpkg":
+            if isinstance(data, gpd.GeoDataFrame):
+                data.to_file(path, driver="GPKG")
+        elif output_format == "parquet":
+            path.parent.mkdir(exist_ok=True, parents=True)
+            data.to_parquet(path, compression=uc_dict.get("output_compression", "zstd"))
+        else:
+            raise ValueError(f"Unknown output format '{output_format}', choose from {OUTPUT_FORMATS}.")
+
+
+def estimate_bytes(data):
+    """
+    Rough size of a frame in memory. memory_usage(deep=True) counts only a pointer per geometry, so every
+    geometry column adds 16 bytes per coordinate and GEOMETRY_OVERHEAD_BYTES per object.
+    """
+    size = int(data.memory_usage(index=True, deep=True).sum())
+    for column, dtype in data.dtypes.items():
+        if isinstance(dtype, gpd.array.GeometryDtype):
+            geometries = data[column].values
+            size += int(shapely.get_num_coordinates(geometries).sum()) * 16
+            size += GEOMETRY_OVERHEAD_BYTES * len(geometries)
+    return size
+
+
+class ResultWriter:
+    """
+    Writes output tables in a background thread while the simulation goes on.
+
+    The queue holds at most `max_bytes` of frames (estimated with estimate_bytes, including strings and
+    geometries), submit blocks while it is full. A frame larger than `max_bytes` is accepted when the queue is empty. The first error
+    of a write is raised by the next submit or flush in the calling thread.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._items = collections.deque()
+        self._queued_bytes = 0
+        self._running = False
+        self._error = None
+        self._condition = threading.Condition()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def submit(self, data, uc, dataset_name, uc_dict):
+        # flache Kopie: spätere Änderungen am Original werden durch Copy-on-Write nicht mitgeschrieben
+        data = data.copy(deep=False)
+        size = estimate_bytes(data)
+        with self._condition:
+            self._raise_error()
+            while self._items and self._queued_bytes + size > self.max_bytes:
+                self._condition.wait()
+                self._raise_error()
+            self._items.append((data, uc, dataset_name, uc_dict, size))
+            self._queued_bytes += size
+            if not self._running:
+                self._running = True
+                threading.Thread(target=self._work, name="result-writer", daemon=True).start()
+
+    def _work(self):
+        while True:
+            with self._condition:
+                if not self._items:
+                    self._running = False
+                    self._condition.notify_all()
+                    return
+                data, uc, dataset_name, uc_dict, size = self._items[0]
+            try:
+                write_output(data, uc, dataset_name, uc_dict)
+                print('saving {} in region {} successful'.format(uc, dataset_name))
+            except Exception as e:
+                with self._condition:
+                    if self._error is None:
+                        self._error = e
+            with self._condition:
+                self._items.popleft()
+                self._queued_bytes -= size
+                self._condition.notify_all()
+
+    def flush(self):
+        """Wait until all submitted frames are written, raise the first error of a failed write."""
+        with self._condition:
+            while self._running:
+                self._condition.wait()
+            self._raise_error()
+
+
+def _reset_result_writer():
+    # ein geforkter Prozess (z.B. Prozesspool) erbt weder Thread noch Warteschlange
+    global _result_writer
+    _result_writer = None
+
+
+os.register_at_fork(after_in_child=_reset_result_writer)
+
+
+def flush_results():
+    """Barrier: wait for all output tables of this process submitted by save."""
+    if _result_writer is not None:
+        _result_writer.flush()
+
+
 def save(data: gpd.GeoDataFrame, uc, dataset_name, uc_dict):
+    """
+    Save an output table in the configured formats. With uc_dict["output_queue_mb"] > 0 the table is written
+    in the background, flush_results() waits for it.
+    """
+    global _result_writer
 
-    filename = 'output_{}_{}'.format(uc, dataset_name)
-    save_path_csv = os.path.join(uc_dict["result_dir"], filename + '.csv')
-    save_path_gpkg = os.path.join(uc_dict["result_dir"], filename + '.gpkg')
     data.reset_index(drop=True, inplace=True)
-    data.to_csv(save_path_csv, sep=',', decimal='.')
-    if isinstance(data, gpd.GeoDataFrame):
-        data.to_file(save_path_gpkg, driver="GPKG")
-    print('saving {} in region {} successful'.format(uc, dataset_name))
+    # optionaler Callback, z.B. sammelt der Ensemble-Lauf die Ergebnisse je Standort
+    if uc_dict.get("on_save") is not None:
+        uc_dict["on_save"](data, uc, dataset_name)
+
+    queue_mb = uc_dict.get("output_queue_mb", 0)
+    if queue_mb > 0:
+        if _result_writer is None:
+            _result_writer = ResultWriter(queue_mb * 2 ** 20)
+        _result_writer.submit(data, uc, dataset_name, uc_dict)
+    else:
+        write_output(data, uc, dataset_name, uc_dict)
+        print('saving {} in region {} successful'.format(uc, dataset_name))
+
+
+def read_geo_file(path):
+    """Read a GeoParquet file or partitioned dataset (directory) or any file format readable by gpd.read_file."""
+    path = pathlib.Path(path)
+    if path.suffix == ".parquet" or path.is_dir():
+        return gpd.read_parquet(path)
+    return gpd.read_file(path)
+
+
+def read_output(result_dir, uc, dataset_name):
+    """
+    Read an output table written by save, in the first available format: parquet (partitioned or single
+    file), gpkg, csv. Geometries of csv outputs are parsed from WKT, without CRS.
+    """
+    partitioned = output_path(result_dir, uc, dataset_name, "parquet", partitioned=True)
+    if partitioned.is_file():
+        return gpd.read_parquet(partitioned)
+    for output_format in ("parquet", "gpkg"):
+        path = output_path(result_dir, uc, dataset_name, output_format)
+        if path.is_file():
+            return read_geo_file(path)
+    data = pd.read_csv(output_path(result_dir, uc, dataset_name, "csv"), index_col=0)
+    if "geometry" in data.columns:
+        data = gpd.GeoDataFrame(data, geometry=gpd.GeoSeries.from_wkt(data["geometry"]))
+    return data
+
 
 def save_data(data: gpd.GeoDataFrame, uc, dataset_name, uc_dict):
 
@@ -189,6 +361,32 @@ def save_data(data: gpd.GeoDataFrame, uc, dataset_name, uc_dict):
     print('saving {} in region {} successful'.format(uc, dataset_name))
 
 
+def export_in_background(frames: dict, directory):
+    """
+    Write derived data (name -> GeoDataFrame) as GeoParquet to 'directory' in a background thread, so the
+    simulation does not wait for it. The frames must not be changed afterwards. wait_for_exports() waits
+    for all exports and raises the first error of a failed export.
+    """
+    def write():
+        try:
+            for name, frame in frames.items():
+                frame.to_parquet(pathlib.Path(directory, name + ".parquet"), compression="zstd")
+                print('export of {} successful'.format(name))
+        except Exception as e:
+            _export_errors.append(e)
+
+    thread = threading.Thread(target=write, name="export", daemon=False)
+    thread.start()
+    _export_threads.append(thread)
+
+
+def wait_for_exports():
+    while _export_threads:
+        _export_threads.pop().join()
+    if _export_errors:
+        raise _export_errors.pop(0)
+
+
 if __name__ == '__main__':
     year = 2045
     scenario = "multi-use-flex"
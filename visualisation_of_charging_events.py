@@ -6,6 +6,8 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import os
 
+import utility
+
 def visualisation_cumulated_charging_events():
     import pandas as pd
     import geopandas as gpd
@@ -17,12 +19,12 @@ def visualisation_cumulated_charging_events():
     directory = "results/3_Mehrfachnutzung_Flex_2045/"
     # charging_use_cases = ["home_detached", "home_apartment", "work", "hpc", "retail", "public", "depot"]
     charging_use_cases = ["retail", "public"]
-    pfade = [os.path.join(directory, f"output_{use_case}_charging-events.gpkg") for use_case in charging_use_cases]
 
     alle_gdfs = []
     ziel_crs = "EPSG:4326"
-    for pfad in pfade:
-        gdf = gpd.read_file(pfad)
+    for use_case in charging_use_cases:
+        # liest parquet, gpkg oder csv, je nachdem welches Format geschrieben wurde
+        gdf = utility.read_output(directory, use_case, "charging-events")
         if gdf.crs != ziel_crs:
             gdf = gdf.to_crs(ziel_crs)
         alle_gdfs.append(gdf)
@@ -88,15 +90,11 @@ def visualisation_cumulated_charging_events_alt():
     directory = "results/1_Ref_2035/"
 
     charging_use_cases = ["home_detached", "home_apartment", "work", "hpc", "retail", "public", "depot"]
-    pfade = []
-    for use_case in charging_use_cases:
-        pfade.append(
-            directory + f"output_{use_case}_charging-events.gpkg")
 
     alle_gdfs = []
     ziel_crs = "EPSG:4326"
-    for pfad in pfade:
-        gdf = gpd.read_file(pfad)
+    for use_case in charging_use_cases:
+        gdf = utility.read_output(directory, use_case, "charging-events")
         # In Ziel-CRS umprojizieren
         if gdf.crs != ziel_crs:
             gdf = gdf.to_crs(ziel_crs)
@@ -159,7 +157,7 @@ def create_dynamic_map_multiple_sources(sources, base_time=datetime(2024, 1, 1,
     Erstellt eine dynamische Karte mit mehreren Datensätzen.
 
     Parameters:
-    - sources: Liste von Dictionaries, z.B.:
+    - sources: Liste von Dictionaries ('gpkg' kann auch eine GeoParquet-Datei sein), z.B.:
         [
             {
                 'gpkg': 'daten1.gpkg',
@@ -186,7 +184,7 @@ def create_dynamic_map_multiple_sources(sources, base_time=datetime(2024, 1, 1,
         start_col = source.get('start_col', 'event_start')
         time_col = source.get('end_col', 'event_time')
 
-        gdf = gpd.read_file(gpkg)# , layer=layer)
+        gdf = utility.read_geo_file(gpkg)# , layer=layer)
         gdf = gdf.to_crs(epsg=4326)
 
         for _, row in gdf.iterrows():